@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+from pyrogram import Client
+
+from config import BOT_TOKEN, API_ID, API_HASH
+from uploader import SessionPool, PartUploader, READ_SIZE
+
+
+# ===============================
+# Upload engine benchmark ✅
+# ===============================
+# python bench_upload.py [size_mib] [sessions,...] [workers,...]
+# e.g. python bench_upload.py 64 1,2,4 2,4,8
+# - uploads a random file with every sessions x workers combination and
+#   prints MB/s => pick UPLOAD_SESSIONS / UPLOAD_WORKERS for this host
+# - parts only (upload.SaveBigFilePart), nothing is sent to a chat
+# - each run gets its own pool => connections are opened before the timer
+
+
+def _ints(arg: str):
+    return [int(x) for x in arg.split(",") if x.strip()]
+
+
+def make_file(size_mib: int):
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, "wb") as f:
+        for _ in range(size_mib):
+            f.write(os.urandom(1024 * 1024))
+    return path
+
+
+async def run_once(app, path: str, sessions: int, workers: int):
+    pool = SessionPool(sessions)
+    try:
+        for _ in range(sessions):
+            await pool.get(app)     # warm up: handshakes not timed
+
+        total = os.path.getsize(path)
+        up = PartUploader(app, total, os.path.basename(path), workers=workers, source="bench", pool=pool)
+        await up.start()
+        start = time.monotonic()
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, READ_SIZE)
+                    if not chunk:
+                        break
+                    await up.feed(chunk)
+            await up.finish()
+        finally:
+            await up.close()
+        return total / (time.monotonic() - start)
+    finally:
+        await pool.close()
+
+
+async def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    sessions_list = _ints(sys.argv[2]) if len(sys.argv) > 2 else [1, 2, 4]
+    workers_list = _ints(sys.argv[3]) if len(sys.argv) > 3 else [1, 2, 4, 8]
+
+    path = make_file(size_mib)
+    app = Client("bench_upload", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN, in_memory=True)
+    try:
+        await app.start()
+        print(f"✅ {size_mib} MiB per run")
+        print(f"{'sessions':>8} {'workers':>8} {'MB/s':>8}")
+        for sessions in sessions_list:
+            for workers in workers_list:
+                try:
+                    speed = await run_once(app, path, sessions, workers)
+                    print(f"{sessions:>8} {workers:>8} {speed / 1e6:>8.2f}")
+                except Exception as e:
+                    print(f"{sessions:>8} {workers:>8}   failed: {e}")
+        await app.stop()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    if not BOT_TOKEN or not API_ID or not API_HASH:
+        print("❌ Please set BOT_TOKEN, API_ID, API_HASH in env!")
+        sys.exit(1)
+    asyncio.run(main())
@@ -2,23 +2,32 @@ import os
 import asyncio
 import time
 
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import FloodWait
 from pyrogram.errors.exceptions.bad_request_400 import MessageNotModified
 
-from config import BOT_TOKEN, API_ID, API_HASH, DOWNLOAD_DIR
+from config import BOT_TOKEN, API_ID, API_HASH, DOWNLOAD_DIR, DISK_SWEEP_EVERY, METRICS_EVERY
+from config import SESSION_DIR, RESUME_JOBS
+from net import start_http, close_http
+from media import detect_capabilities
+from store import JOB_STORE, cache_stats, write_state, write_text_state
+from singleflight import detach_user
+from scheduler import SCHEDULER
+from progress import PROGRESS
+from disk import DISK
+from tasks import TASKS
+from uploader import UPLOAD_POOL
+import metrics
 
 # ✅ Modules
-from url import is_url, url_flow, url_callback_router
-from insta import is_instagram_url, clean_insta_url, insta_entry
+from url import is_url, url_flow, url_callback_router, start_url_job, restore_url_state
+from insta import is_instagram_url, clean_insta_url, insta_entry, start_insta_job
 
 
 # ===========================
 # GLOBALS
 # ===========================
-USER_TASKS = {}
-USER_CANCEL = set()
 USER_STATE = {}
 UI_STATUS_MSG = {}      # uid -> status message
 LAST_WARN = {}
@@ -33,6 +42,7 @@ async def safe_send(message, text, reply_markup=None):
         try:
             return await message.reply(text, reply_markup=reply_markup)
         except FloodWait as e:
+            metrics.FLOODWAIT_SECONDS.inc(int(e.value), source="send")
             await asyncio.sleep(int(e.value) + 1)
         except:
             return None
@@ -73,7 +83,8 @@ async def get_or_create_status(message, uid):
     - reduces mixed progress text
     """
     old = UI_STATUS_MSG.get(uid)
-    if old:
+    # ✅ keep status of a job that is still running / queued
+    if old and not TASKS.busy(uid, old.id):
         try:
             await safe_edit(old, "✅ Previous status cleared ✅", reply_markup=None)
         except:
@@ -111,11 +122,15 @@ WELCOME_TEXT = (
 # ===========================
 # BOT INIT
 # ===========================
+# ✅ session file in SESSION_DIR (persistent volume) => restart skips the
+# auth handshake and keeps the peer cache
+os.makedirs(SESSION_DIR, exist_ok=True)
 app = Client(
     "MultiFunctionBot",
     bot_token=BOT_TOKEN,
     api_id=API_ID,
-    api_hash=API_HASH
+    api_hash=API_HASH,
+    workdir=SESSION_DIR
 )
 
 
@@ -173,14 +188,27 @@ async def cancel_task(client, cb):
     except:
         return await safe_answer(cb, "Invalid")
 
-    USER_CANCEL.add(uid)
+    mid = cb.message.id if cb.message else None
 
-    task = USER_TASKS.get(uid)
-    if task and not task.done():
-        task.cancel()
+    # ✅ shared (coalesced) job: only this user leaves, others keep it
+    flight = detach_user(uid, mid)
+    if flight:
+        handle = TASKS.release(uid, mid)
+        # ✅ leader's task keeps running for the others => drop the record now
+        TASKS.forget(handle)
+        if handle and handle.task is not flight.task:
+            handle.cancel()
+        await safe_answer(cb, "✅ Cancelled!")
+        return await PROGRESS.edit(cb.message, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
+
+    # ✅ only the job behind this status (other queued jobs stay);
+    # stale / double-tapped button => nothing left to cancel
+    if not TASKS.cancel(uid, mid):
+        return await safe_answer(cb, "✅ Already finished")
 
     await safe_answer(cb, "✅ Cancelled!")
-    await safe_edit(cb.message, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
+    # ✅ via coalescer => pending progress of this message can't overwrite it
+    await PROGRESS.edit(cb.message, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
 
 
 # ===========================
@@ -193,7 +221,6 @@ async def all_callbacks(client, cb):
     if data.startswith("url_"):
         return await url_callback_router(
             client, cb,
-            USER_TASKS, USER_CANCEL,
             get_or_create_status,
             main_menu_keyboard,
             DOWNLOAD_DIR
@@ -214,7 +241,7 @@ async def text_handler(client, message):
         return
 
     if is_instagram_url(text):
-        return await insta_entry(client, message, clean_insta_url(text), USER_TASKS, main_menu_keyboard)
+        return await insta_entry(client, message, clean_insta_url(text), main_menu_keyboard)
 
     if is_url(text):
         USER_STATE[uid] = "WAIT_URL"
@@ -227,7 +254,7 @@ async def text_handler(client, message):
 
     if state == "WAIT_INSTA":
         if is_instagram_url(text):
-            return await insta_entry(client, message, clean_insta_url(text), USER_TASKS, main_menu_keyboard)
+            return await insta_entry(client, message, clean_insta_url(text), main_menu_keyboard)
         return await safe_send(message, "❌ Instagram Reel link ayakku ✅", reply_markup=back_keyboard())
 
     now = time.time()
@@ -236,11 +263,156 @@ async def text_handler(client, message):
         return await safe_send(message, "❌ Menu select cheyyu ✅", reply_markup=main_menu_keyboard())
 
 
+# ===========================
+# LIFECYCLE
+# ===========================
+async def stats_loop():
+    """
+    ✅ Snapshot for web.py /health (cache hit/miss counters, queue depths, edit budget, disk usage)
+    """
+    while True:
+        try:
+            write_state("stats.json", {
+                "time": int(time.time()),
+                "caches": cache_stats(),
+                "scheduler": SCHEDULER.stats(),
+                "progress": PROGRESS.stats(),
+                "disk": DISK.stats(),
+                "tasks": TASKS.stats(),
+                "upload_sessions": UPLOAD_POOL.stats(),
+                "jobs_store": JOB_STORE.stats(),
+            })
+        except Exception as e:
+            print(f"⚠️ Stats snapshot failed: {e}")
+        await asyncio.sleep(30)
+
+
+def collect_metrics():
+    """
+    gauges + cache totals read from their owners right before a snapshot
+    """
+    sched = SCHEDULER.stats()
+    metrics.JOBS_RUNNING.set(sched["running"])
+    metrics.QUEUE_DEPTH.set(sched["backlog"], queue="jobs")
+    for name, st in sched["stages"].items():
+        metrics.QUEUE_DEPTH.set(st["queued"], queue=name)
+        metrics.STAGE_ACTIVE.set(st["active"], stage=name)
+
+    disk = DISK.stats()
+    metrics.QUEUE_DEPTH.set(disk["waiting"], queue="disk")
+    metrics.DISK_RESERVED.set(disk["reserved"])
+    metrics.DISK_BUDGET_BYTES.set(disk["budget"])
+
+    metrics.TASKS_BY_STAGE.values.clear()
+    for stage, n in TASKS.stats()["by_stage"].items():
+        metrics.TASKS_BY_STAGE.set(n, stage=stage)
+
+    edits = PROGRESS.stats()
+    metrics.QUEUE_DEPTH.set(edits["pending"], queue="edits")
+    metrics.EDIT_BUDGET.set(edits["rate"])
+
+    for name, st in cache_stats().items():
+        metrics.CACHE_LOOKUPS.set_total(st["hits"], cache=name, result="hit")
+        metrics.CACHE_LOOKUPS.set_total(st["misses"], cache=name, result="miss")
+        metrics.CACHE_HIT_RATE.set(st["hit_rate"], cache=name)
+
+
+async def metrics_loop():
+    """
+    ✅ Prometheus text for web.py /metrics (separate process => file in DATA_DIR)
+    """
+    while True:
+        try:
+            collect_metrics()
+            write_text_state(metrics.METRICS_FILE, metrics.render())
+        except Exception as e:
+            print(f"⚠️ Metrics snapshot failed: {e}")
+        await asyncio.sleep(METRICS_EVERY)
+
+
+async def disk_janitor():
+    """
+    ✅ Stale files (crashed / killed jobs) + budget refresh
+    """
+    while True:
+        await asyncio.sleep(DISK_SWEEP_EVERY)
+        try:
+            await DISK.sweep()
+        except Exception as e:
+            print(f"⚠️ Disk sweep failed: {e}")
+
+
+async def resume_jobs():
+    """
+    ✅ jobs queued / running when the last process stopped => queued again in
+    arrival order (same status message if it still exists; a saved partial
+    download continues where it stopped)
+    """
+    restored = 0
+    for rec in JOB_STORE.pending():
+        JOB_STORE.done(rec["key"])
+        uid, chat_id, args = rec["uid"], rec["chat_id"], rec["args"]
+        try:
+            status = await app.get_messages(chat_id, rec["status_id"])
+            if not status or status.empty:
+                status = await app.send_message(chat_id, "♻️ Bot restarted ✅\n\n⏳ Resuming your job...")
+            else:
+                await safe_edit(status, "♻️ Bot restarted ✅\n\n⏳ Resuming your job...")
+            UI_STATUS_MSG[uid] = status
+
+            if rec["kind"] == "url":
+                await start_url_job(
+                    app, uid, chat_id, status, args["url"], args["mode"],
+                    main_menu_keyboard, DOWNLOAD_DIR, rec["created"]
+                )
+            elif rec["kind"] == "insta":
+                await start_insta_job(app, uid, chat_id, status, args["url"], main_menu_keyboard, rec["created"])
+            else:
+                continue
+            restored += 1
+        except Exception as e:
+            print(f"⚠️ Resume {rec['key']} failed: {e}")
+    JOB_STORE.restored += restored
+    return restored
+
+
+async def main():
+    """
+    ✅ Shared HTTP pool lives exactly as long as the Pyrogram client
+    """
+    caps = await detect_capabilities()
+    print(f"✅ Tools: ffmpeg={caps.ffmpeg_version or 'missing'} aria2c={caps.aria2c_version or 'missing'}")
+
+    removed = await DISK.sweep(startup=True)
+    print(f"✅ Disk: {removed} orphan(s) removed, budget {DISK.budget // (1024 * 1024)} MiB")
+
+    await start_http()
+    try:
+        await app.start()
+        print("✅ Bot started...")
+        if RESUME_JOBS:
+            urls = restore_url_state()
+            jobs = await resume_jobs()
+            print(f"✅ Restored {jobs} job(s), {urls} pending URL choice(s)")
+        stats_task = asyncio.create_task(stats_loop())
+        janitor_task = asyncio.create_task(disk_janitor())
+        metrics_task = asyncio.create_task(metrics_loop())
+        await idle()
+        stats_task.cancel()
+        janitor_task.cancel()
+        metrics_task.cancel()
+        # ✅ unfinished jobs stay in STATE_DB => resumed by the next process
+        await TASKS.shutdown()
+        await UPLOAD_POOL.close()
+        await app.stop()
+    finally:
+        await close_http()
+
+
 if __name__ == "__main__":
     if not BOT_TOKEN or not API_ID or not API_HASH:
         print("❌ Please set BOT_TOKEN, API_ID, API_HASH in env!")
         raise SystemExit
 
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    print("✅ Bot started...")
-    app.run()
+    app.run(main())
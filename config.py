@@ -5,3 +5,84 @@ API_ID = int(os.getenv("API_ID", "0"))
 API_HASH = os.getenv("API_HASH", "")
 
 DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "downloads")
+
+# ✅ URL uploader: parallel ranged download
+URL_SEGMENTS = int(os.getenv("URL_SEGMENTS", "4"))
+URL_SEGMENT_MIN_SIZE = int(os.getenv("URL_SEGMENT_MIN_SIZE", str(8 * 1024 * 1024)))
+URL_RETRIES = int(os.getenv("URL_RETRIES", "5"))
+
+# ✅ Shared HTTP connection pool (net.py)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "16"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "30"))
+
+# ✅ Video pipeline: remux when keyframes are at most this far apart (seconds)
+VIDEO_MAX_KEYINT = float(os.getenv("VIDEO_MAX_KEYINT", "10"))
+
+# ✅ ffmpeg/ffprobe time limits (seconds)
+FFPROBE_TIMEOUT = float(os.getenv("FFPROBE_TIMEOUT", "60"))
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", str(3 * 60 * 60)))
+
+# ✅ Transcode pool: concurrent encodes + ffmpeg threads per encode (0 = auto from CPU count)
+TRANSCODE_SLOTS = int(os.getenv("TRANSCODE_SLOTS", "0"))
+TRANSCODE_THREADS = int(os.getenv("TRANSCODE_THREADS", "0"))
+
+# ✅ Local state shared with web.py (capabilities, metrics, caches)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# ✅ Warm restart: Pyrogram session (auth key + peer cache) and pending jobs /
+# URL choices kept on disk => keep DATA_DIR (and DOWNLOAD_DIR, partial
+# downloads resume) on a persistent volume
+SESSION_DIR = os.getenv("SESSION_DIR", DATA_DIR)
+STATE_DB = os.path.join(DATA_DIR, "state.sqlite3")
+RESUME_JOBS = os.getenv("RESUME_JOBS", "1") == "1"
+RESUME_MAX_AGE = int(os.getenv("RESUME_MAX_AGE", str(6 * 3600)))
+
+# ✅ Telegram file_id cache (SQLite in DATA_DIR)
+CACHE_DB = os.path.join(DATA_DIR, "cache.sqlite3")
+INSTA_CACHE_TTL = int(os.getenv("INSTA_CACHE_TTL", str(7 * 24 * 3600)))
+INSTA_CACHE_MAX = int(os.getenv("INSTA_CACHE_MAX", "5000"))
+URL_CACHE_TTL = int(os.getenv("URL_CACHE_TTL", str(30 * 24 * 3600)))
+URL_CACHE_MAX = int(os.getenv("URL_CACHE_MAX", "20000"))
+
+# ✅ Instagram: yt-dlp engine ("lib" = in-process warm workers, "cli" = spawn yt-dlp)
+INSTA_ENGINE = os.getenv("INSTA_ENGINE", "lib")
+YTDL_WORKERS = int(os.getenv("YTDL_WORKERS", "4"))
+
+# ✅ Job scheduler: global/per-user admission + per-stage slots (scheduler.py)
+JOBS_MAX_ACTIVE = int(os.getenv("JOBS_MAX_ACTIVE", "8"))
+JOBS_MAX_BACKLOG = int(os.getenv("JOBS_MAX_BACKLOG", "50"))
+JOBS_PER_USER = int(os.getenv("JOBS_PER_USER", "5"))
+JOBS_USER_ACTIVE = int(os.getenv("JOBS_USER_ACTIVE", "1"))
+DOWNLOAD_SLOTS = int(os.getenv("DOWNLOAD_SLOTS", "6"))
+UPLOAD_SLOTS = int(os.getenv("UPLOAD_SLOTS", "4"))
+
+# ✅ Progress edits: shared msgs/sec budget (adapts to FloodWait) + min seconds between edits of one message
+EDIT_RATE = float(os.getenv("EDIT_RATE", "8"))
+EDIT_RATE_MIN = float(os.getenv("EDIT_RATE_MIN", "0.5"))
+EDIT_RATE_MAX = float(os.getenv("EDIT_RATE_MAX", "20"))
+EDIT_INTERVAL = float(os.getenv("EDIT_INTERVAL", "3"))
+
+# ✅ Upload engine (uploader.py): parallel parts over pooled media sessions;
+# STREAM_UPLOAD => file mode uploads while downloading (no local copy) when size is known
+STREAM_UPLOAD = os.getenv("STREAM_UPLOAD", "1") == "1"
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))       # parts in flight per upload
+UPLOAD_SESSIONS = int(os.getenv("UPLOAD_SESSIONS", "2"))     # media connections shared by all uploads
+UPLOAD_BUFFER_PARTS = int(os.getenv("UPLOAD_BUFFER_PARTS", "16"))
+
+# ✅ Video mode: pipe the download straight into ffmpeg (encode overlaps download)
+STREAM_TRANSCODE = os.getenv("STREAM_TRANSCODE", "0") == "1"
+
+# ✅ Disk budget for DOWNLOAD_DIR (disk.py): 0 = auto (free space - DISK_MIN_FREE)
+DISK_BUDGET = int(os.getenv("DISK_BUDGET", "0"))
+DISK_MIN_FREE = int(os.getenv("DISK_MIN_FREE", str(1024 * 1024 * 1024)))
+DISK_VIDEO_FACTOR = float(os.getenv("DISK_VIDEO_FACTOR", "2.2"))
+DISK_UNKNOWN_SIZE = int(os.getenv("DISK_UNKNOWN_SIZE", str(512 * 1024 * 1024)))
+DISK_INSTA_RESERVE = int(os.getenv("DISK_INSTA_RESERVE", str(200 * 1024 * 1024)))
+DISK_SWEEP_EVERY = int(os.getenv("DISK_SWEEP_EVERY", "600"))
+DISK_STALE_AGE = int(os.getenv("DISK_STALE_AGE", str(6 * 3600)))
+DISK_PARTIAL_TTL = int(os.getenv("DISK_PARTIAL_TTL", str(24 * 3600)))
+
+# ✅ Prometheus snapshot for web.py /metrics (seconds between writes)
+METRICS_EVERY = float(os.getenv("METRICS_EVERY", "10"))
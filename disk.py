@@ -0,0 +1,195 @@
+import os
+import time
+import errno
+import shutil
+import asyncio
+from collections import deque
+
+from config import (
+    DOWNLOAD_DIR, DISK_BUDGET, DISK_MIN_FREE, DISK_VIDEO_FACTOR, DISK_UNKNOWN_SIZE,
+    DISK_STALE_AGE, DISK_PARTIAL_TTL,
+)
+
+
+# ===============================
+# Disk budget for DOWNLOAD_DIR (one per bot process) ✅
+# ===============================
+# - a job reserves its worst case before writing (size x transcode factor)
+# - reservations over budget wait FIFO (position reported like other queues)
+# - budget = DISK_BUDGET, or auto: DOWNLOAD_DIR usage + free space - DISK_MIN_FREE
+# - janitor: orphans removed at startup, stale files on a timer
+
+
+def disk_estimate(size: int, mode: str = "file"):
+    """
+    bytes a job may need: download (+ `_seekfix.mp4` copy in video mode)
+    """
+    size = size if size and size > 0 else DISK_UNKNOWN_SIZE
+    factor = DISK_VIDEO_FACTOR if mode == "video" else 1.0
+    return int(size * factor)
+
+
+def is_disk_full(e: BaseException):
+    return isinstance(e, OSError) and e.errno in (errno.ENOSPC, errno.EDQUOT)
+
+
+class DiskBudget:
+    def __init__(self, root: str, budget: int, min_free: int):
+        self.root = root
+        self.fixed_budget = budget
+        self.min_free = min_free
+        self.budget = budget
+        self.reserved = 0
+        self.dir_bytes = 0
+        self.free_bytes = 0
+        self.swept = 0
+        self._queue = deque()   # (nbytes, future)
+
+    # ---------- budget ----------
+    def refresh(self, dir_bytes: int = None):
+        """
+        auto budget is recomputed here only (startup / janitor tick): bytes
+        written by running jobs are in dir_bytes, so the sum stays stable
+        """
+        if dir_bytes is not None:
+            self.dir_bytes = dir_bytes
+        try:
+            self.free_bytes = shutil.disk_usage(self.root).free
+        except OSError:
+            self.free_bytes = 0
+        if not self.fixed_budget:
+            self.budget = max(0, self.dir_bytes + self.free_bytes - self.min_free)
+        self._wake()
+
+    def _fits(self, nbytes: int):
+        return self.reserved + nbytes <= self.budget
+
+    def _wake(self):
+        while self._queue:
+            nbytes, fut = self._queue[0]
+            if fut.done():
+                self._queue.popleft()
+                continue
+            if not self._fits(nbytes):
+                return
+            self._queue.popleft()
+            self.reserved += nbytes
+            fut.set_result(True)
+
+    # ---------- reservations ----------
+    async def acquire(self, nbytes: int, on_queue=None):
+        """
+        returns a ticket (reserved bytes) => release(ticket) when the job's
+        files are gone; waits while the budget is full
+        """
+        if not self.free_bytes:
+            self.refresh()
+        if nbytes > self.budget:
+            raise Exception(
+                f"Not enough disk space on server (needs {nbytes // (1024 * 1024)} MiB, "
+                f"budget {self.budget // (1024 * 1024)} MiB)"
+            )
+        if not self._queue and self._fits(nbytes):
+            self.reserved += nbytes
+            return nbytes
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (nbytes, fut)
+        self._queue.append(entry)
+        last = None
+        try:
+            while not fut.done():
+                pos = self._queue.index(entry) + 1 if entry in self._queue else 0
+                if on_queue and pos and pos != last:
+                    last = pos
+                    await on_queue(pos)
+                await asyncio.wait([fut], timeout=2)
+        except:
+            if fut.done() and not fut.cancelled():
+                self.release(nbytes)
+            else:
+                fut.cancel()
+                try:
+                    self._queue.remove(entry)
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+        return nbytes
+
+    def release(self, ticket):
+        if not ticket:
+            return
+        self.reserved = max(0, self.reserved - ticket)
+        self._wake()
+
+    # ---------- janitor ----------
+    def _sweep(self, startup: bool):
+        """
+        (blocking, run in a thread)
+        startup => nothing is running, every leftover except young partial
+        downloads is an orphan; timer => only entries untouched for DISK_STALE_AGE
+        """
+        now = time.time()
+        removed = 0
+        total = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0, 0
+
+        for e in entries:
+            try:
+                st = e.stat(follow_symlinks=False)
+                age = now - st.st_mtime
+                partial = e.name.endswith(".part") or e.name.endswith(".part.json")
+                if partial:
+                    stale = age > DISK_PARTIAL_TTL
+                else:
+                    stale = startup or age > DISK_STALE_AGE
+
+                if not stale:
+                    total += _entry_size(e, st)
+                    continue
+
+                if e.is_dir(follow_symlinks=False):
+                    shutil.rmtree(e.path, ignore_errors=True)
+                else:
+                    os.remove(e.path)
+                removed += 1
+            except OSError:
+                continue
+        return removed, total
+
+    async def sweep(self, startup: bool = False):
+        os.makedirs(self.root, exist_ok=True)
+        removed, total = await asyncio.to_thread(self._sweep, startup)
+        self.swept += removed
+        self.refresh(total)
+        return removed
+
+    def stats(self):
+        return {
+            "budget": self.budget,
+            "reserved": self.reserved,
+            "waiting": len(self._queue),
+            "dir_bytes": self.dir_bytes,
+            "free_bytes": self.free_bytes,
+            "swept": self.swept,
+        }
+
+
+def _entry_size(e, st):
+    if not e.is_dir(follow_symlinks=False):
+        return st.st_size
+    size = 0
+    for root, _dirs, files in os.walk(e.path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+DISK = DiskBudget(DOWNLOAD_DIR, DISK_BUDGET, DISK_MIN_FREE)
@@ -1,22 +1,49 @@
 import os
 import re
-import time
 import json
+import time
+import shutil
 import asyncio
-import subprocess
+import tempfile
+import humanize
 
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import FloodWait
 
+from config import CACHE_DB, INSTA_CACHE_TTL, INSTA_CACHE_MAX, INSTA_ENGINE, DISK_INSTA_RESERVE
+from ytdl import ytdl_download, available as ytdl_available
+from store import FileIdCache, JOB_STORE, media_file_id
+from singleflight import join_or_start, follow, sub_key
+import progress
+from scheduler import SCHEDULER, DOWNLOAD_GATE, UPLOAD_GATE, queued_text
+from tasks import TASKS
+from disk import DISK, is_disk_full
+from media import capabilities, probe, frame_probe, forget_probe, MediaInfo
+from uploader import upload_path, send_uploaded_video
+from metrics import (
+    JOBS, JOB_SECONDS, DOWNLOAD_BYTES, DOWNLOAD_SPEED, UPLOAD_SPEED,
+    FLOODWAIT_SECONDS, observe_speed,
+)
+
 DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "downloads")
 
-INSTA_REGEX = re.compile(r"(https?://(www\.)?instagram\.com/(reel|p)/[A-Za-z0-9_\-]+)")
+INSTA_REGEX = re.compile(r"(https?://(www\.)?instagram\.com/(reel|p)/([A-Za-z0-9_\-]+))")
+
+FILEPATH_MARK = "FILEPATH:"   # yt-dlp --print prefix of the final output path
+INFO_MARK = "INFO:"           # yt-dlp --print prefix of duration/width/height JSON
+THUMB_MAX = 200 * 1024        # Telegram ignores bigger thumbnails
+STALL_TIMEOUT = 90            # seconds without yt-dlp output / progress => killed
 
+# "[download]  45.3% of ~  10.50MiB at    1.23MiB/s ETA 00:05 (frag 3/10)"
+PROGRESS_LINE = re.compile(
+    r"\[download\]\s+(?P<percent>\d+(?:\.\d+)?)%"
+    r"(?:\s+of\s+~?\s*\S+)?"
+    r"(?:\s+at\s+(?P<speed>Unknown B/s|\S+))?"
+    r"(?:\s+ETA\s+(?P<eta>\S+))?"
+)
 
-try:
-    from bot import USER_CANCEL
-except:
-    USER_CANCEL = set()
+# ✅ shortcode -> Telegram file_id (repeat reels => instant resend)
+REEL_CACHE = FileIdCache(CACHE_DB, "insta_reels", INSTA_CACHE_TTL, INSTA_CACHE_MAX)
 
 
 def is_instagram_url(text: str) -> bool:
@@ -28,6 +55,11 @@ def clean_insta_url(text: str) -> str:
     return m.group(1) if m else (text or "").strip()
 
 
+def insta_shortcode(text: str) -> str:
+    m = INSTA_REGEX.search(text or "")
+    return m.group(4) if m else ""
+
+
 # ===============================
 # FLOODWAIT SAFE HELPERS ✅
 # ===============================
@@ -36,73 +68,77 @@ async def safe_send(message, text, reply_markup=None):
         try:
             return await message.reply(text, reply_markup=reply_markup)
         except FloodWait as e:
+            FLOODWAIT_SECONDS.inc(int(e.value), source="send")
             await asyncio.sleep(int(e.value) + 1)
         except:
             return None
 
 
 async def safe_edit(msg, text, reply_markup=None):
-    if not msg:
-        return
-    while True:
-        try:
-            await msg.edit(text, reply_markup=reply_markup)
-            return
-        except FloodWait as e:
-            await asyncio.sleep(int(e.value) + 1)
-        except:
-            return
+    # ✅ through the edit coalescer (FloodWait pause shared by all jobs)
+    await progress.edit(msg, text, reply_markup)
 
 
 # ===============================
-# ffprobe metadata
+# thumbnail + send_video numbers ✅
 # ===============================
-def ffprobe_info(path: str):
-    try:
-        cmd = [
-            "ffprobe", "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height:format=duration",
-            "-of", "json", path
-        ]
-        out = subprocess.check_output(cmd).decode("utf-8", errors="ignore")
-        data = json.loads(out)
-
-        duration = float(data.get("format", {}).get("duration", 0) or 0)
-        streams = data.get("streams", []) or []
-        width = int(streams[0].get("width", 0) or 0) if streams else 0
-        height = int(streams[0].get("height", 0) or 0) if streams else 0
-
-        return {"duration": duration, "width": width, "height": height}
-    except:
-        return {"duration": 0, "width": 0, "height": 0}
+def _ytdlp_thumb(job_dir: str):
+    """
+    JPEG written by yt-dlp (--write-thumbnail), if Telegram can use it
+    """
+    for name in ("reel.jpg", "reel.jpeg"):
+        path = os.path.join(job_dir, name)
+        try:
+            if 5000 < os.path.getsize(path) <= THUMB_MAX:
+                return path
+        except OSError:
+            pass
+    return None
 
 
-# ===============================
-# middle thumbnail
-# ===============================
-def make_thumb(video_path: str):
-    info = ffprobe_info(video_path)
-    duration = info.get("duration", 0) or 0
-    ts = 1 if duration <= 0 else max(1, int(duration / 2))
+async def inspect_reel(video_path: str, meta: dict):
+    """
+    ✅ cheapest source first, at most ONE ffmpeg/ffprobe process:
+    - yt-dlp numbers + yt-dlp JPEG => nothing spawned
+    - yt-dlp JPEG only => cached probe
+    - else one ffmpeg run grabs the middle frame and reads the header
+    returns (MediaInfo, thumb path or None)
+    """
+    thumb = _ytdlp_thumb(os.path.dirname(video_path))
+    if meta.get("duration") and meta.get("width") and meta.get("height"):
+        info = MediaInfo(duration=meta["duration"], width=meta["width"], height=meta["height"], ok=True)
+        if thumb:
+            return info, thumb
+    elif thumb:
+        return await probe(video_path), thumb
+    else:
+        info = None
 
     thumb_path = video_path + ".jpg"
+    seek = meta["duration"] / 2 if meta.get("duration") else 1
+    grabbed = await frame_probe(video_path, thumb_path, seek)
+    ok = os.path.exists(thumb_path) and os.path.getsize(thumb_path) > 5000
+    return info or grabbed, thumb_path if ok else None
+
+
+async def send_reel(client, chat_id, video_path: str, meta: dict, caption: str):
+    """
+    ✅ video parts start uploading at once; thumbnail/numbers are prepared
+    meanwhile and only needed for the final SendMedia
+    """
+    upload = asyncio.ensure_future(upload_path(client, video_path, source="insta"))
     try:
-        cmd = [
-            "ffmpeg", "-y",
-            "-ss", str(ts),
-            "-i", video_path,
-            "-vframes", "1",
-            "-vf", "scale=640:-1",
-            "-q:v", "3",
-            thumb_path
-        ]
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if os.path.exists(thumb_path) and os.path.getsize(thumb_path) > 5000:
-            return thumb_path
-    except:
-        pass
-    return None
+        info, thumb = await inspect_reel(video_path, meta)
+        thumb_file = await upload_path(client, thumb, source="insta") if thumb else None
+        input_file = await upload
+    finally:
+        if not upload.done():
+            upload.cancel()
+
+    return await send_uploaded_video(
+        client, chat_id, input_file, os.path.basename(video_path), caption,
+        duration=int(info.duration), width=info.width, height=info.height, thumb=thumb_file
+    )
 
 
 def square_bar(percent: float) -> str:
@@ -124,23 +160,120 @@ def square_bar(percent: float) -> str:
     return f"{bar}  {percent:.1f}%"
 
 
-def has_aria2c():
-    try:
-        subprocess.run(["aria2c", "-v"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return True
-    except:
-        return False
+async def has_aria2c():
+    return (await capabilities()).has_aria2c
 
 
 # ===============================
 # yt-dlp download ✅
 # ===============================
-async def insta_download(url: str, uid: int, status_msg):
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    url = clean_insta_url(url)
+def reel_progress_text(percent: float, speed: str = "", eta: str = ""):
+    extra = ""
+    if speed or eta:
+        extra = f"⚡ {speed or '--'}   ⏳ {eta or '--'}\n\n"
+    return (
+        f"📥 Instagram Reel Detected ✅\n\n"
+        f"⬇️ Downloading Reel...\n\n"
+        f"{square_bar(percent)}\n\n"
+        f"{extra}"
+        f"⏳ Please wait..."
+    )
+
+
+def parse_progress(line: str):
+    """
+    (percent, speed, eta) of a yt-dlp progress line, else None
+    """
+    m = PROGRESS_LINE.search(line)
+    if not m:
+        return None
+    speed = m.group("speed") or ""
+    eta = m.group("eta") or ""
+    return (
+        float(m.group("percent")),
+        "" if speed.startswith("Unknown") else speed,
+        "" if eta.startswith("Unknown") else eta,
+    )
+
+
+async def _download_lib(url: str, outtmpl: str, uid: int, status_msg, handle):
+    """
+    ✅ Warm in-process yt-dlp (ytdl.py), progress from hooks
+    wakes on: download done / cancel event / 1s progress tick;
+    no hook call for STALL_TIMEOUT => aborted
+    """
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+    state = {"seen": time.monotonic()}
+
+    def on_progress(d):
+        state.update(d)
+        state["seen"] = time.monotonic()
+
+    dl = asyncio.ensure_future(ytdl_download(url, outtmpl, on_progress=on_progress))
+    cancel = asyncio.ensure_future(handle.cancelled.wait())
+
+    try:
+        while not dl.done():
+            await asyncio.wait([dl, cancel], timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            handle.check()
+            if not dl.done() and time.monotonic() - state["seen"] > STALL_TIMEOUT:
+                raise Exception("Download timeout / No response from Instagram")
+
+            total = state.get("total") or 0
+            if not total:
+                continue
+            percent = min(100.0, state.get("downloaded", 0) * 100.0 / total)
+            speed = state.get("speed") or 0
+            progress.publish(
+                status_msg, reel_progress_text,
+                percent,
+                humanize.naturalsize(speed, binary=True) + "/s" if speed else "",
+                f"{int(state.get('eta') or 0)}s" if state.get("eta") else "",
+                reply_markup=kb
+            )
 
-    outtmpl = os.path.join(DOWNLOAD_DIR, f"insta_{uid}_{int(time.time())}.%(ext)s")
+        path, info = dl.result()
+    finally:
+        cancel.cancel()
+        if not dl.done():
+            dl.cancel()
+
+    if not path or not os.path.exists(path):
+        raise Exception("Downloaded file not found")
+    return path, reel_meta(info)
 
+
+async def _cli_lines(proc, handle):
+    """
+    ✅ stdout lines of yt-dlp; each wait races the next line against the
+    job's cancel event and a STALL_TIMEOUT watchdog (quiet phases like
+    extraction / aria2c / merge included) => no blocked readline
+    """
+    cancel = asyncio.ensure_future(handle.cancelled.wait())
+    read = None
+    try:
+        while True:
+            read = asyncio.ensure_future(proc.stdout.readline())
+            done, _ = await asyncio.wait([read, cancel], timeout=STALL_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            if cancel in done:
+                raise asyncio.CancelledError
+            if not done:
+                raise Exception("Download timeout / No response from Instagram")
+
+            line = read.result()
+            if not line:
+                return
+            yield line.decode("utf-8", errors="ignore").strip()
+    finally:
+        cancel.cancel()
+        if read and not read.done():
+            read.cancel()
+
+
+async def _download_cli(url: str, outtmpl: str, uid: int, status_msg, handle):
+    """
+    Fallback: spawn yt-dlp CLI and parse its stdout
+    """
     cmd = [
         "yt-dlp",
         "--no-playlist",
@@ -150,11 +283,15 @@ async def insta_download(url: str, uid: int, status_msg):
         "--retries", "3",
         "--fragment-retries", "3",
         "-f", "best[ext=mp4]/best",
+        "--progress",
+        "--write-thumbnail",
+        "--print", f"after_move:{INFO_MARK}%(.{{duration,width,height}})j",
+        "--print", f"after_move:{FILEPATH_MARK}%(filepath)s",
         "-o", outtmpl,
         url
     ]
 
-    if has_aria2c():
+    if await has_aria2c():
         cmd.insert(1, "--downloader")
         cmd.insert(2, "aria2c")
         cmd.insert(3, "--downloader-args")
@@ -163,147 +300,201 @@ async def insta_download(url: str, uid: int, status_msg):
     proc = await asyncio.create_subprocess_exec(
         *cmd,
         stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT
+        stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
     )
 
     kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+    path = None
+    info = {}
+
+    # ✅ registered on the job => cancel kills yt-dlp (+ aria2c) at once
+    async with handle.child(proc):
+        async for s in _cli_lines(proc, handle):
+            # ✅ exact final path (after merge / remux) reported by yt-dlp itself
+            if s.startswith(FILEPATH_MARK):
+                path = s[len(FILEPATH_MARK):]
+                continue
+            if s.startswith(INFO_MARK):
+                try:
+                    info = json.loads(s[len(INFO_MARK):])
+                except ValueError:
+                    pass
+                continue
+
+            p = parse_progress(s)
+            if p:
+                progress.publish(status_msg, reel_progress_text, *p, reply_markup=kb)
+
+        await proc.wait()
+    handle.check()
+    if proc.returncode != 0:
+        raise Exception("Insta download failed (yt-dlp error)")
 
-    last_edit = 0
-    last_percent = -1.0
-    last_output_time = time.time()
+    if not path or not os.path.exists(path):
+        raise Exception("Downloaded file not found")
+    return path, reel_meta(info)
 
-    while True:
-        if uid in USER_CANCEL:
-            try:
-                proc.kill()
-            except:
-                pass
-            raise asyncio.CancelledError
 
-        # ✅ Prevent infinite hang (no output)
-        if time.time() - last_output_time > 90:
-            try:
-                proc.kill()
-            except:
-                pass
-            raise Exception("Download timeout / No response from Instagram")
-
-        line = await proc.stdout.readline()
-        if not line:
-            break
-
-        last_output_time = time.time()
-
-        s = line.decode("utf-8", errors="ignore").strip()
-
-        m = re.search(r"\[download\]\s+(\d+(?:\.\d+)?)%", s)
-        if m:
-            percent = float(m.group(1))
-            now = time.time()
-            if (percent - last_percent >= 2.0) and (now - last_edit >= 8):
-                last_percent = percent
-                last_edit = now
-                await safe_edit(
-                    status_msg,
-                    f"📥 Instagram Reel Detected ✅\n\n"
-                    f"⬇️ Downloading Reel...\n\n"
-                    f"{square_bar(percent)}\n\n"
-                    f"⏳ Please wait...",
-                    reply_markup=kb
-                )
-
-    await proc.wait()
-    if proc.returncode != 0:
-        raise Exception("Insta download failed (yt-dlp error)")
+def reel_meta(info: dict):
+    """
+    yt-dlp info => send_video numbers (0 = unknown)
+    """
+    def num(k):
+        try:
+            return max(0, int(float((info or {}).get(k) or 0)))
+        except (TypeError, ValueError):
+            return 0
+    return {"duration": num("duration"), "width": num("width"), "height": num("height")}
 
-    base = outtmpl.replace("%(ext)s", "")
-    for ext in ["mp4", "mkv", "webm"]:
-        p = base + ext
-        if os.path.exists(p):
-            return p
 
-    files = [f for f in os.listdir(DOWNLOAD_DIR) if f.startswith(f"insta_{uid}_")]
-    if not files:
-        raise Exception("Downloaded file not found")
-    files.sort(key=lambda x: os.path.getmtime(os.path.join(DOWNLOAD_DIR, x)), reverse=True)
-    return os.path.join(DOWNLOAD_DIR, files[0])
+def new_job_dir(uid: int):
+    """
+    ✅ own scratch dir per job: output path never collides with another job,
+    cleanup = one rmtree
+    """
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"insta_{uid}_", dir=DOWNLOAD_DIR)
+
+
+async def insta_download(url: str, uid: int, status_msg, job_dir: str, handle):
+    """
+    returns (video path, reel_meta dict); yt-dlp's thumbnail lands in job_dir
+    """
+    url = clean_insta_url(url)
+
+    outtmpl = os.path.join(job_dir, "reel.%(ext)s")
+
+    if INSTA_ENGINE != "cli" and ytdl_available():
+        return await _download_lib(url, outtmpl, uid, status_msg, handle)
+    return await _download_cli(url, outtmpl, uid, status_msg, handle)
 
 
 # =========================
 # Upload animation
 # =========================
-async def upload_anim(uid: int, status_msg, label: str):
+def upload_anim_text(label: str, step: int):
+    frames = ["⚪", "🟥", "🟧", "🟨", "🟩", "✅"]
+    fill = frames[step % len(frames)]
+    bar = (fill * (step % 12)) + ("⬜" * (12 - (step % 12)))
+    return (
+        f"📥 Instagram Reel Detected ✅\n\n"
+        f"⬆️ {label}\n\n"
+        f"{bar}\n\n"
+        f"⏳ Please wait..."
+    )
+
+
+async def upload_anim(uid: int, status_msg, label: str, handle):
     kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
     step = 0
-    last_edit = 0
-    frames = ["⚪", "🟥", "🟧", "🟨", "🟩", "✅"]
 
     while True:
-        if uid in USER_CANCEL:
+        if handle.is_cancelled():
             return
 
-        now = time.time()
-        if now - last_edit >= 8:
-            last_edit = now
-            step += 1
-            fill = frames[step % len(frames)]
-            bar = (fill * (step % 12)) + ("⬜" * (12 - (step % 12)))
-
-            await safe_edit(
-                status_msg,
-                f"📥 Instagram Reel Detected ✅\n\n"
-                f"⬆️ {label}\n\n"
-                f"{bar}\n\n"
-                f"⏳ Please wait...",
-                reply_markup=kb
-            )
-
-        await asyncio.sleep(1.0)
+        step += 1
+        progress.publish(status_msg, upload_anim_text, label, step, reply_markup=kb)
+        await asyncio.sleep(8.0)
 
 
 # =========================
 # ENTRY
 # =========================
-async def insta_entry(client, message, url: str, USER_TASKS, main_menu_keyboard):
+async def send_cached_reel(client, chat_id, shortcode: str):
+    """
+    ✅ Cache hit => resend by file_id (no download, no upload)
+    stale/invalid file_id => dropped from cache, returns False
+    FloodWait => waited out and retried once, then normal download path
+    """
+    hit = REEL_CACHE.get(shortcode) if shortcode else None
+    if not hit:
+        return False
+    for attempt in range(2):
+        try:
+            await client.send_cached_media(chat_id=chat_id, file_id=hit["file_id"], caption="✅ Instagram Reel 🎥")
+            return True
+        except FloodWait as e:
+            FLOODWAIT_SECONDS.inc(int(e.value), source="send")
+            if attempt:
+                return False    # file_id still fine => keep it cached
+            await asyncio.sleep(int(e.value) + 1)
+        except:
+            REEL_CACHE.delete(shortcode)
+            return False
+    return False
+
+
+async def insta_entry(client, message, url: str, main_menu_keyboard):
     uid = message.from_user.id
+    shortcode = insta_shortcode(url)
+
+    if await send_cached_reel(client, message.chat.id, shortcode):
+        JOBS.inc(type="insta", outcome="cached")
+        return
 
     status = await safe_send(message, "📥 Instagram Reel Detected ✅\n\n⏳ Starting...")
     if not status:
         return
 
-    async def job():
+    await start_insta_job(client, uid, message.chat.id, status, url, main_menu_keyboard)
+
+
+async def start_insta_job(client, uid: int, chat_id: int, status, url: str, main_menu_keyboard, created: float = None):
+    """
+    queue (or attach to) the reel job behind `status`; also used by bot.py
+    to start unfinished jobs again after a restart
+    """
+    shortcode = insta_shortcode(url)
+
+    async def job(flight):
+        # ✅ status edits fan out to every user attached to this reel
+        status = flight.status
+        job_dir = None
         file_path = None
-        thumb_path = None
         anim_task = None
-        try:
-            USER_CANCEL.discard(uid)
-
-            file_path = await insta_download(url, uid, status)
+        disk_ticket = None
+        outcome = "failed"
+        started = time.time()
 
-            if uid in USER_CANCEL:
-                raise asyncio.CancelledError
+        def waiting_for(stage):
+            async def on_queue(pos):
+                kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+                handle.set_stage(f"wait_{stage.replace(' ', '_')}")
+                await safe_edit(status, f"🕒 Waiting for {stage} slot...\n\nQueue position: **#{pos}**", kb)
+            return on_queue
 
-            anim_task = asyncio.create_task(upload_anim(uid, status, "Uploading Reel..."))
-
-            thumb_path = make_thumb(file_path)
-            info = ffprobe_info(file_path)
-
-            args = {}
-            if info.get("duration", 0) > 0:
-                args["duration"] = int(info["duration"])
-            if info.get("width", 0) > 0:
-                args["width"] = int(info["width"])
-            if info.get("height", 0) > 0:
-                args["height"] = int(info["height"])
-
-            await client.send_video(
-                chat_id=message.chat.id,
-                video=file_path,
-                caption="✅ Instagram Reel 🎥",
-                supports_streaming=True,
-                thumb=thumb_path if thumb_path and os.path.exists(thumb_path) else None,
-                **args
-            )
+        try:
+            handle.set_stage("start")
+            async with DOWNLOAD_GATE.slot(waiting_for("download")):
+                # ✅ disk reserved once the slot is ours => queued reels hold nothing
+                disk_ticket = await DISK.acquire(DISK_INSTA_RESERVE, waiting_for("disk space"))
+                job_dir = new_job_dir(uid)
+                handle.set_stage("download")
+                dl_start = time.time()
+                file_path, meta = await insta_download(url, uid, status, job_dir, handle)
+            size = os.path.getsize(file_path)
+            DOWNLOAD_BYTES.inc(size, source="insta")
+            observe_speed(DOWNLOAD_SPEED, "insta", size, time.time() - dl_start)
+
+            handle.check()
+
+            anim_task = asyncio.create_task(upload_anim(uid, status, "Uploading Reel...", handle))
+
+            # ✅ first attached user gets the upload, others a file_id resend
+            # (thumbnail + duration/size prepared while the parts upload)
+            async with UPLOAD_GATE.slot():
+                handle.set_stage("upload")
+                up_start = time.time()
+                target_uid, chat_id = flight.upload_target()
+                sent = await send_reel(client, chat_id, file_path, meta, "✅ Instagram Reel 🎥")
+                observe_speed(UPLOAD_SPEED, "insta", size, time.time() - up_start)
+            file_id = media_file_id(sent)
+            flight.delivered.add(target_uid)
+            REEL_CACHE.put(shortcode, file_id)
+            handle.set_stage("deliver")
+            await flight.deliver(client, file_id, "✅ Instagram Reel 🎥")
+            outcome = "done"
 
             if anim_task and not anim_task.done():
                 anim_task.cancel()
@@ -313,31 +504,61 @@ async def insta_entry(client, message, url: str, USER_TASKS, main_menu_keyboard)
         except asyncio.CancelledError:
             if anim_task and not anim_task.done():
                 anim_task.cancel()
-            await safe_edit(status, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
+            if TASKS.closing:
+                # ✅ restart, not the cancel button => job comes back
+                outcome = "restarted"
+                await safe_edit(status, "♻️ Bot restarting...\n\n⏳ This reel continues automatically after the restart.")
+            else:
+                outcome = "cancelled"
+                await safe_edit(status, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
 
         except Exception as e:
             if anim_task and not anim_task.done():
                 anim_task.cancel()
+            if is_disk_full(e):
+                e = "Server disk is full, try again later"
             await safe_edit(status, f"❌ Insta Failed!\n\nError: `{e}`", reply_markup=main_menu_keyboard())
 
         finally:
-            USER_CANCEL.discard(uid)
-
             try:
                 if anim_task and not anim_task.done():
                     anim_task.cancel()
             except:
                 pass
 
-            try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
-            try:
-                if thumb_path and os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-            except:
-                pass
+            # ✅ reel, thumbnail, yt-dlp leftovers => one call
+            if job_dir:
+                shutil.rmtree(job_dir, ignore_errors=True)
+            if file_path:
+                forget_probe(file_path)
+
+            DISK.release(disk_ticket)
+            JOBS.inc(type="insta", outcome=outcome)
+            JOB_SECONDS.observe(time.time() - started, type="insta")
 
-    USER_TASKS[uid] = asyncio.create_task(job())
+    def scheduled(flight):
+        # ✅ waits for its turn (per-user FIFO, round-robin across users)
+        async def on_queue(pos):
+            kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+            await safe_edit(flight.status, queued_text(pos), kb)
+
+        async def on_reject(reason):
+            JOBS.inc(type="insta", outcome="rejected")
+            await safe_edit(flight.status, reason, reply_markup=main_menu_keyboard())
+
+        return SCHEDULER.run(uid, lambda: job(flight), on_queue, on_reject)
+
+    # ✅ cancel token + stage of this job (cancel button => handle.cancel())
+    handle = TASKS.open(uid, status.id, "insta")
+
+    # ✅ unfinished until the task ends => restored after a restart
+    handle.record = f"insta:{uid}:{status.id}"
+    JOB_STORE.add(handle.record, "insta", uid, chat_id, status.id, {"url": url}, created)
+
+    # ✅ same reel already downloading => attach instead of 2nd download
+    flight, leader = await join_or_start(f"insta:{shortcode or url}", uid, chat_id, status, scheduled)
+    if leader:
+        TASKS.bind(handle, flight.task)
+    else:
+        handle.kind = "follow"
+        TASKS.bind(handle, asyncio.create_task(follow(flight, sub_key(uid, status))))
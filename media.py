@@ -0,0 +1,439 @@
+import os
+import re
+import json
+import shutil
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+
+from config import FFPROBE_TIMEOUT, FFMPEG_TIMEOUT, VIDEO_MAX_KEYINT
+from store import write_state
+
+
+# ===============================
+# Async media tools (ffmpeg / ffprobe / aria2c ...)
+# ===============================
+# ✅ Never blocks the event loop:
+# - child runs via asyncio.create_subprocess_exec
+# - task cancelled => child killed
+# - timeout => child killed + Exception
+
+
+async def _kill(proc):
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+async def run_tool(cmd, timeout: float = FFMPEG_TIMEOUT, capture: bool = False, capture_stderr: bool = False):
+    """
+    Run external tool.
+    returns: (returncode, stdout_bytes or b"")  (stderr bytes if capture_stderr)
+    Raises FileNotFoundError if tool missing, Exception on timeout.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE if capture else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE if capture_stderr else asyncio.subprocess.DEVNULL,
+    )
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        await _kill(proc)
+        raise Exception(f"{cmd[0]} timed out after {timeout:g}s")
+    except asyncio.CancelledError:
+        await _kill(proc)
+        raise
+
+    return proc.returncode, (err if capture_stderr else out) or b""
+
+
+async def run_piped(cmd, feed, on_progress=None, timeout: float = FFMPEG_TIMEOUT):
+    """
+    Run tool with stdin fed by us (ffmpeg -i pipe:0 ... -progress pipe:1)
+    feed(stdin) -> coroutine writing the input (stdin closed afterwards)
+    on_progress(dict) <- each "-progress" block (out_time_us, speed, ...)
+    returns: returncode ; tool killed on cancel / timeout / feed error
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    async def _feed():
+        try:
+            await feed(proc.stdin)
+        except (BrokenPipeError, ConnectionResetError):
+            pass    # tool exited early => its return code tells why
+        finally:
+            try:
+                proc.stdin.close()
+            except:
+                pass
+
+    async def _read():
+        block = {}
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                return
+            k, _, v = line.decode("utf-8", errors="ignore").strip().partition("=")
+            block[k] = v
+            if k == "progress":
+                if on_progress:
+                    on_progress(block)
+                block = {}
+
+    async def _all():
+        await feeder
+        await reader
+        await proc.wait()
+
+    feeder = asyncio.create_task(_feed())
+    reader = asyncio.create_task(_read())
+    try:
+        await asyncio.wait_for(_all(), timeout=timeout)
+    except asyncio.TimeoutError:
+        await _kill(proc)
+        raise Exception(f"{cmd[0]} timed out after {timeout:g}s")
+    except BaseException:
+        await _kill(proc)
+        raise
+    finally:
+        for t in (feeder, reader):
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(feeder, reader, return_exceptions=True)
+
+    return proc.returncode
+
+
+async def tool_output(cmd, timeout: float = FFPROBE_TIMEOUT):
+    """
+    async check_output(): stdout text, Exception on non-zero exit
+    """
+    code, out = await run_tool(cmd, timeout=timeout, capture=True)
+    if code != 0:
+        raise Exception(f"{cmd[0]} exited with code {code}")
+    return out.decode("utf-8", errors="ignore")
+
+
+# ===============================
+# Node capabilities (detected once) ✅
+# ===============================
+CAPABILITIES_FILE = "capabilities.json"
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    ffmpeg: str = ""            # path ("" => missing)
+    ffmpeg_version: str = ""
+    ffprobe: str = ""
+    ffprobe_version: str = ""
+    aria2c: str = ""
+    aria2c_version: str = ""
+    encoders: frozenset = field(default_factory=frozenset)
+
+    @property
+    def has_ffmpeg(self):
+        return bool(self.ffmpeg and self.ffprobe)
+
+    @property
+    def has_aria2c(self):
+        return bool(self.aria2c)
+
+    def has_encoder(self, name: str):
+        return name in self.encoders
+
+    def as_dict(self):
+        d = asdict(self)
+        d["encoders"] = sorted(self.encoders)
+        return d
+
+
+_CAPS = None
+_CAPS_LOCK = asyncio.Lock()
+
+
+async def _tool_version(path: str, flag: str):
+    """
+    first line => "ffmpeg version 6.1.1 ..." / "aria2 version 1.37.0"
+    """
+    try:
+        out = await tool_output([path, flag], timeout=15)
+        words = (out.splitlines() or [""])[0].split()
+        if "version" in words and words.index("version") + 1 < len(words):
+            return words[words.index("version") + 1]
+        return " ".join(words[:3])
+    except asyncio.CancelledError:
+        raise
+    except:
+        return ""
+
+
+async def _ffmpeg_encoders(path: str):
+    """
+    `ffmpeg -encoders` rows look like: " V....D libx264   libx264 H.264 ..."
+    """
+    try:
+        out = await tool_output([path, "-hide_banner", "-encoders"], timeout=15)
+    except asyncio.CancelledError:
+        raise
+    except:
+        return frozenset()
+
+    names = set()
+    started = False
+    for line in out.splitlines():
+        if line.strip().startswith("------"):
+            started = True
+            continue
+        parts = line.split()
+        if started and len(parts) >= 2:
+            names.add(parts[1])
+    return frozenset(names)
+
+
+async def detect_capabilities():
+    """
+    ✅ Startup probe: tool paths, versions, ffmpeg encoders
+    (spawns a few processes ONCE; everything later reads the cached object)
+    """
+    global _CAPS
+    async with _CAPS_LOCK:
+        ffmpeg = shutil.which("ffmpeg") or ""
+        ffprobe = shutil.which("ffprobe") or ""
+        aria2c = shutil.which("aria2c") or ""
+
+        _CAPS = Capabilities(
+            ffmpeg=ffmpeg,
+            ffmpeg_version=await _tool_version(ffmpeg, "-version") if ffmpeg else "",
+            ffprobe=ffprobe,
+            ffprobe_version=await _tool_version(ffprobe, "-version") if ffprobe else "",
+            aria2c=aria2c,
+            aria2c_version=await _tool_version(aria2c, "-v") if aria2c else "",
+            encoders=await _ffmpeg_encoders(ffmpeg) if ffmpeg else frozenset(),
+        )
+
+    save_capabilities(_CAPS)
+    return _CAPS
+
+
+def save_capabilities(caps: Capabilities):
+    """
+    web.py runs in another process => share via small JSON file
+    """
+    write_state(CAPABILITIES_FILE, caps.as_dict())
+
+
+async def capabilities():
+    """
+    ✅ Free after startup (detect_capabilities already ran)
+    """
+    if _CAPS is None:
+        return await detect_capabilities()
+    return _CAPS
+
+
+# ===============================
+# Probe once per file ✅
+# ===============================
+KEYFRAME_WINDOW = 30    # seconds scanned for keyframe spacing
+PROBE_CACHE_SIZE = 128
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """
+    One ffprobe pass => everything the pipeline needs
+    (remux decision, thumbnail seek, upload duration/size)
+    """
+    duration: float = 0.0
+    width: int = 0
+    height: int = 0
+    vcodec: str = ""
+    pix_fmt: str = ""
+    acodec: str = ""
+    bitrate: int = 0
+    max_keyint: float = 0.0
+    keyint_known: bool = True   # False => truncated input too short to judge
+    ok: bool = False
+
+
+_PROBE_CACHE = OrderedDict()    # path -> (mtime_ns, size, MediaInfo)
+_PROBE_INFLIGHT = {}            # (path, mtime_ns, size) -> Task
+
+
+def _parse_probe(data: dict):
+    fmt = data.get("format") or {}
+
+    v_stream = None
+    acodec = ""
+    for st in data.get("streams", []) or []:
+        if st.get("codec_type") == "video" and v_stream is None and not (st.get("disposition") or {}).get("attached_pic"):
+            v_stream = st
+        elif st.get("codec_type") == "audio" and not acodec:
+            acodec = st.get("codec_name") or ""
+    v_stream = v_stream or {}
+
+    try:
+        duration = float(fmt.get("duration") or 0)
+    except:
+        duration = 0.0
+    try:
+        bitrate = int(fmt.get("bit_rate") or 0)
+    except:
+        bitrate = 0
+
+    keys = []
+    pts = []
+    for pkt in data.get("packets", []) or []:
+        if pkt.get("stream_index") != v_stream.get("index"):
+            continue
+        try:
+            t = float(pkt["pts_time"])
+        except:
+            continue
+        pts.append(t)
+        if "K" in (pkt.get("flags") or ""):
+            keys.append(t)
+    keys.sort()
+
+    window = min(KEYFRAME_WINDOW, duration) if duration else KEYFRAME_WINDOW
+    scanned = max(pts) - min(pts) if pts else 0.0
+    # truncated input (stream head): container duration is the whole file,
+    # only the packets we actually saw can be judged (1s = last frame slack)
+    truncated = 0 < scanned < window - 1
+    keyint_known = True
+    if truncated:
+        window = scanned
+        keyint_known = len(keys) >= 2 and scanned >= VIDEO_MAX_KEYINT
+    if len(keys) >= 2:
+        max_keyint = max(b - a for a, b in zip(keys, keys[1:]))
+        # tail of scanned window without another keyframe counts too
+        max_keyint = max(max_keyint, window - (keys[-1] - keys[0]))
+    else:
+        max_keyint = window
+
+    return MediaInfo(
+        duration=duration,
+        width=int(v_stream.get("width") or 0),
+        height=int(v_stream.get("height") or 0),
+        vcodec=v_stream.get("codec_name") or "",
+        pix_fmt=v_stream.get("pix_fmt") or "",
+        acodec=acodec,
+        bitrate=bitrate,
+        max_keyint=max_keyint,
+        keyint_known=keyint_known,
+        ok=True,
+    )
+
+
+async def _run_probe(path: str):
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_format", "-show_streams",
+        "-show_entries", "packet=stream_index,pts_time,flags",
+        "-read_intervals", f"%+{KEYFRAME_WINDOW}",
+        "-of", "json",
+        path
+    ]
+    try:
+        return _parse_probe(json.loads(await tool_output(cmd)))
+    except asyncio.CancelledError:
+        raise
+    except:
+        return MediaInfo()
+
+
+async def probe(path: str):
+    """
+    ✅ Memoized by path + mtime + size: the same file is probed once,
+    concurrent callers share the running ffprobe
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return MediaInfo()
+
+    hit = _PROBE_CACHE.get(path)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        _PROBE_CACHE.move_to_end(path)
+        return hit[2]
+
+    key = (path, st.st_mtime_ns, st.st_size)
+    task = _PROBE_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run_probe(path))
+        _PROBE_INFLIGHT[key] = task
+        task.add_done_callback(lambda _t: _PROBE_INFLIGHT.pop(key, None))
+
+    info = await asyncio.shield(task)
+    if info.ok:
+        _PROBE_CACHE[path] = (st.st_mtime_ns, st.st_size, info)
+        _PROBE_CACHE.move_to_end(path)
+        while len(_PROBE_CACHE) > PROBE_CACHE_SIZE:
+            _PROBE_CACHE.popitem(last=False)
+    return info
+
+
+def forget_probe(path: str):
+    """
+    call when a file is deleted (path may be reused later)
+    """
+    _PROBE_CACHE.pop(path, None)
+
+
+# ===============================
+# Thumbnail + basic info in one ffmpeg run ✅
+# ===============================
+# ffmpeg prints the input header on stderr while grabbing the frame =>
+# no separate ffprobe process for short clips (reels)
+_DURATION_RE = re.compile(rb"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_VIDEO_RE = re.compile(rb"Stream #\S+.*?: Video: ([a-z0-9_]+).*?, (\d{2,5})x(\d{2,5})[ ,]")
+
+
+def _parse_header(text: bytes):
+    m = _DURATION_RE.search(text)
+    if not m:
+        return MediaInfo()
+    h, mi, sec = m.groups()
+    v = _VIDEO_RE.search(text)
+    return MediaInfo(
+        duration=int(h) * 3600 + int(mi) * 60 + float(sec),
+        width=int(v.group(2)) if v else 0,
+        height=int(v.group(3)) if v else 0,
+        vcodec=v.group(1).decode() if v else "",
+        ok=True,
+    )
+
+
+async def frame_probe(path: str, thumb_path: str, seek: float = 1.0, width: int = 640):
+    """
+    ✅ one ffmpeg: JPEG frame at `seek` -> thumb_path + MediaInfo from its
+    stderr header (duration / size / codec; no keyframe scan)
+    seek past the end => no frame, info still filled
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-ss", f"{max(0.0, seek):.2f}",
+        "-i", path,
+        "-frames:v", "1",
+        "-vf", f"scale={width}:-2",
+        "-q:v", "3",
+        thumb_path
+    ]
+    try:
+        _code, err = await run_tool(cmd, timeout=FFPROBE_TIMEOUT, capture_stderr=True)
+    except asyncio.CancelledError:
+        raise
+    except:
+        return MediaInfo()
+    return _parse_header(err)
+
@@ -0,0 +1,149 @@
+import math
+
+
+# ===============================
+# Prometheus metrics (one registry per bot process) ✅
+# ===============================
+# - counters / gauges / histograms in plain dicts (no client library)
+# - bot.py renders the text format into DATA_DIR every METRICS_EVERY s,
+#   web.py (separate gunicorn process) serves that file on /metrics
+# - bytes/sec => rate(bot_download_bytes_total[5m]) on the Prometheus side,
+#   per-job speed => *_speed_bytes histograms
+
+METRICS_FILE = "metrics.prom"
+
+REGISTRY = []
+
+SPEED_BUCKETS = (
+    64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2,
+    64 * 1024 ** 2, 256 * 1024 ** 2,
+)
+SECONDS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}    # sorted label pairs -> value
+        REGISTRY.append(self)
+
+    @staticmethod
+    def _key(labels: dict):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(key)} {_num(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount > 0:
+            key = self._key(labels)
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """
+        total counted elsewhere (cache hits/misses live on FileIdCache)
+        """
+        self.values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self.values.items()):
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(key, [('le', _num(bound))])} {n}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+def render():
+    lines = []
+    for m in REGISTRY:
+        if m.values:
+            lines += m.render()
+    return "\n".join(lines) + "\n"
+
+
+# ===============================
+# Bot metrics
+# ===============================
+JOBS = Counter("bot_jobs_total", "Finished jobs by type (url_file, url_video, insta) and outcome")
+JOB_SECONDS = Histogram("bot_job_seconds", "Job run time after admission", SECONDS_BUCKETS)
+
+DOWNLOAD_BYTES = Counter("bot_download_bytes_total", "Bytes downloaded from sources")
+UPLOAD_BYTES = Counter("bot_upload_bytes_total", "Bytes uploaded to Telegram")
+DOWNLOAD_SPEED = Histogram("bot_download_speed_bytes", "Average download speed per job (bytes/sec)", SPEED_BUCKETS)
+UPLOAD_SPEED = Histogram("bot_upload_speed_bytes", "Average upload speed per job (bytes/sec)", SPEED_BUCKETS)
+
+STAGE_SECONDS = Histogram("bot_stage_seconds", "Time jobs spend per stage (queued, download, upload ...)", SECONDS_BUCKETS)
+TRANSCODE_SECONDS = Histogram("bot_transcode_seconds", "ffmpeg run time by plan and pipeline", SECONDS_BUCKETS)
+FLOODWAIT_SECONDS = Counter("bot_floodwait_seconds_total", "Seconds Telegram asked us to wait, by caller")
+
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Waiters per queue (jobs, stages, disk, progress edits)")
+STAGE_ACTIVE = Gauge("bot_stage_active", "Busy slots per pipeline stage")
+JOBS_RUNNING = Gauge("bot_jobs_running", "Admitted jobs")
+TASKS_BY_STAGE = Gauge("bot_tasks", "Live tasks (jobs + attached followers) by current stage")
+EDIT_BUDGET = Gauge("bot_edit_rate", "Progress edits/sec budget")
+DISK_RESERVED = Gauge("bot_disk_reserved_bytes", "Bytes reserved in DOWNLOAD_DIR")
+DISK_BUDGET_BYTES = Gauge("bot_disk_budget_bytes", "DOWNLOAD_DIR byte budget")
+CACHE_LOOKUPS = Counter("bot_cache_lookups_total", "file_id cache lookups by result")
+CACHE_HIT_RATE = Gauge("bot_cache_hit_rate", "file_id cache hit rate since start")
+
+
+def observe_speed(hist, source: str, nbytes: int, seconds: float):
+    if nbytes > 0 and seconds > 0:
+        hist.observe(nbytes / seconds, source=source)
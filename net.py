@@ -0,0 +1,61 @@
+import asyncio
+import aiohttp
+
+from config import HTTP_POOL_LIMIT, HTTP_POOL_PER_HOST, HTTP_DNS_TTL, HTTP_KEEPALIVE
+
+# -------------------------
+# Shared aiohttp session (one per process)
+# -------------------------
+_SESSION = None
+_LOCK = asyncio.Lock()
+
+
+def _new_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        use_dns_cache=True,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        enable_cleanup_closed=True,
+    )
+    # ✅ no session-wide timeout => each request passes its own
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=None),
+        headers={"User-Agent": "Mozilla/5.0"},
+    )
+
+
+async def start_http():
+    """
+    ✅ Called once on bot startup (before app.start)
+    """
+    global _SESSION
+    async with _LOCK:
+        if _SESSION is None or _SESSION.closed:
+            _SESSION = _new_session()
+    return _SESSION
+
+
+async def get_session():
+    """
+    ✅ Borrow the shared session (lazy create if startup hook didn't run)
+    Never close it in callers.
+    """
+    if _SESSION is None or _SESSION.closed:
+        return await start_http()
+    return _SESSION
+
+
+async def close_http():
+    """
+    ✅ Called on bot shutdown (after app.stop)
+    """
+    global _SESSION
+    async with _LOCK:
+        if _SESSION is not None and not _SESSION.closed:
+            await _SESSION.close()
+            # let SSL transports finish closing
+            await asyncio.sleep(0.25)
+        _SESSION = None
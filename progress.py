@@ -0,0 +1,210 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+from pyrogram.types import Message
+from pyrogram.errors import FloodWait
+from pyrogram.errors.exceptions.bad_request_400 import MessageNotModified
+
+from config import EDIT_RATE, EDIT_RATE_MIN, EDIT_RATE_MAX, EDIT_INTERVAL
+from metrics import FLOODWAIT_SECONDS
+
+
+# ===============================
+# Progress edit coalescer (one per bot process) ✅
+# ===============================
+# - jobs publish numbers + a render fn, never call msg.edit for progress
+# - only the latest state per status message is kept (older ones dropped)
+# - unchanged text => no edit
+# - all edits share one msgs/sec budget: halved on FloodWait (+ global pause),
+#   slowly raised again while edits succeed
+# - same status message edited at most every EDIT_INTERVAL seconds
+
+
+def _msg_key(msg):
+    chat = getattr(msg, "chat", None)
+    if chat is not None and getattr(msg, "id", None) is not None:
+        return (chat.id, msg.id)
+    return id(msg)
+
+
+class ProgressHub:
+    def __init__(self, rate: float, rate_min: float, rate_max: float, interval: float):
+        self.rate = rate
+        self.rate_min = rate_min
+        self.rate_max = max(rate_min, rate_max)
+        self.interval = interval
+        self.pending = OrderedDict()    # key -> (msg, render, args, kb)
+        self.shown = OrderedDict()      # key -> (text, kb, time) of last edit
+        self.next_slot = 0.0            # budget: earliest time of next edit
+        self.hold_until = 0.0           # FloodWait => nobody edits before this
+        self.floods = 0
+        self.edits = 0
+        self.skipped = 0
+        self._ok_streak = 0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    # ---------- job side ----------
+    def publish(self, msg, render, args=(), reply_markup=None):
+        """
+        latest state for `msg`; text = render(*args) at flush time
+        """
+        if not msg:
+            return
+        key = _msg_key(msg)
+        self.pending[key] = (msg, render, args, reply_markup)
+        self._ensure_task()
+        self._wake.set()
+
+    def drop(self, msg):
+        self.pending.pop(_msg_key(msg), None)
+
+    async def edit(self, msg, text, reply_markup=None):
+        """
+        ✅ stage / final text: sent in the next budget slot (queue positions
+        of many waiters => spread, not a burst), replaces pending progress
+        of this message; FloodWait => renderer sends it after the pause
+        """
+        if not msg:
+            return
+        key = _msg_key(msg)
+        self.pending.pop(key, None)
+        while True:
+            wait = max(self.hold_until, self.next_slot) - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if not await self._send(key, msg, text, reply_markup):
+            # kept, not dropped (a newer state published meanwhile wins)
+            self.pending.setdefault(key, (msg, str, (text,), reply_markup))
+            self._ensure_task()
+            self._wake.set()
+
+    # ---------- renderer ----------
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _pick(self, now: float):
+        """
+        (key, None) => due now, least recently shown first
+        (None, t)   => nothing due before t (None = nothing pending)
+        """
+        best = None
+        next_due = None
+        for key in self.pending:
+            shown = self.shown.get(key)
+            due = shown[2] + self.interval if shown else 0
+            if due <= now:
+                if best is None or due < best[1]:
+                    best = (key, due)
+            elif next_due is None or due < next_due:
+                next_due = due
+        if best:
+            return best[0], None
+        return None, next_due
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            wait = max(self.hold_until, self.next_slot) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            key, next_due = self._pick(now)
+            if key is None:
+                self._wake.clear()
+                try:
+                    timeout = None if next_due is None else next_due - now
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            msg, render, args, kb = self.pending.pop(key)
+            try:
+                text = render(*args)
+            except Exception:
+                continue
+
+            if not await self._send(key, msg, text, kb):
+                # FloodWait => retry later unless a newer state arrived
+                self.pending.setdefault(key, (msg, render, args, kb))
+
+    async def _send(self, key, msg, text, kb):
+        """
+        False only on FloodWait (caller may retry)
+        """
+        shown = self.shown.get(key)
+        if shown and shown[0] == text and shown[1] == repr(kb):
+            self.skipped += 1
+            return True
+
+        self.next_slot = time.monotonic() + 1.0 / self.rate
+        try:
+            await msg.edit(text, reply_markup=kb)
+        except MessageNotModified:
+            pass
+        except FloodWait as e:
+            self._flood(int(e.value))
+            return False
+        except Exception:
+            # deleted message / no rights => forget it
+            self.shown.pop(key, None)
+            return True
+
+        self.edits += 1
+        self._remember(key, text, kb)
+        self._ok_streak += 1
+        if self._ok_streak >= 20:
+            self._ok_streak = 0
+            self.rate = min(self.rate_max, self.rate + 1)
+        return True
+
+    def _flood(self, seconds: int):
+        self.floods += 1
+        FLOODWAIT_SECONDS.inc(seconds, source="edit")
+        self._ok_streak = 0
+        self.rate = max(self.rate_min, self.rate / 2)
+        self.hold_until = max(self.hold_until, time.monotonic() + seconds + 1)
+
+    def _remember(self, key, text, kb):
+        self.shown[key] = (text, repr(kb), time.monotonic())
+        self.shown.move_to_end(key)
+        while len(self.shown) > 2000:
+            self.shown.popitem(last=False)
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 2),
+            "pending": len(self.pending),
+            "edits": self.edits,
+            "skipped": self.skipped,
+            "floods": self.floods,
+        }
+
+
+PROGRESS = ProgressHub(EDIT_RATE, EDIT_RATE_MIN, EDIT_RATE_MAX, EDIT_INTERVAL)
+
+
+def publish(target, render, *args, reply_markup=None):
+    """
+    status Message => hub; shared status (singleflight) fans out itself
+    """
+    if target is None:
+        return
+    if isinstance(target, Message):
+        PROGRESS.publish(target, render, args, reply_markup)
+    else:
+        target.publish(render, *args, reply_markup=reply_markup)
+
+
+async def edit(target, text, reply_markup=None):
+    if target is None:
+        return
+    if isinstance(target, Message):
+        await PROGRESS.edit(target, text, reply_markup)
+    else:
+        await target.edit(text, reply_markup=reply_markup)
@@ -0,0 +1,267 @@
+import asyncio
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+
+from config import (
+    JOBS_MAX_ACTIVE, JOBS_MAX_BACKLOG, JOBS_PER_USER, JOBS_USER_ACTIVE,
+    DOWNLOAD_SLOTS, UPLOAD_SLOTS,
+)
+
+
+# ===============================
+# Job scheduler (one per bot process) ✅
+# ===============================
+# - admission: at most JOBS_MAX_ACTIVE jobs run, the rest wait in per-user FIFO queues
+# - fairness: waiting users take turns (round-robin), one user cannot starve others
+# - backlog full / too many jobs of one user => SchedulerFull (clear reject message)
+# - stages: download / transcode / upload have own FIFO slot limits
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+class StageGate:
+    """
+    ✅ FIFO limiter for one pipeline stage (download / transcode / upload)
+    - at most `slots` holders at once
+    - waiters served strictly in arrival order
+    - on_queue(position) is awaited whenever a waiter's position changes
+    - cancelled waiter (cancel button => task.cancel()) leaves the queue
+    """
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.active = 0
+        self._queue = deque()
+
+    def queued(self):
+        return len(self._queue)
+
+    def free(self):
+        """
+        slot() would be granted without waiting
+        """
+        return self.active < self.slots and not self._queue
+
+    def _wake(self):
+        while self._queue and self.active < self.slots:
+            fut = self._queue.popleft()
+            if not fut.done():
+                self.active += 1
+                fut.set_result(True)
+
+    async def _wait_turn(self, on_queue):
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.append(fut)
+        last = None
+        try:
+            while not fut.done():
+                pos = self._queue.index(fut) + 1 if fut in self._queue else 0
+                if on_queue and pos and pos != last:
+                    last = pos
+                    await on_queue(pos)
+                await asyncio.wait([fut], timeout=2)
+        except:
+            if fut.done() and not fut.cancelled():
+                # slot granted right as we got cancelled => pass it on
+                self.active -= 1
+                self._wake()
+            else:
+                fut.cancel()
+                try:
+                    self._queue.remove(fut)
+                except ValueError:
+                    pass
+            raise
+
+    @asynccontextmanager
+    async def slot(self, on_queue=None):
+        if self.active < self.slots and not self._queue:
+            self.active += 1
+        else:
+            await self._wait_turn(on_queue)
+
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._wake()
+
+    def stats(self):
+        return {"slots": self.slots, "active": self.active, "queued": self.queued()}
+
+
+class Scheduler:
+    def __init__(self, max_active: int, max_backlog: int, per_user: int, user_active: int):
+        self.max_active = max(1, max_active)
+        self.max_backlog = max(0, max_backlog)
+        self.per_user = max(1, per_user)
+        self.user_active = max(1, user_active)
+        self.running = 0
+        self.active = {}                # uid -> running jobs
+        self.waiting = OrderedDict()    # uid -> deque[future]
+        self.served = {}                # uid -> turn number of last admission
+        self._turn = 0
+        self.stages = {}                # name -> StageGate
+
+    # ---------- stages ----------
+    def register_stage(self, name: str, slots: int):
+        self.stages[name] = StageGate(slots)
+        return self.stages[name]
+
+    def stage(self, name: str):
+        return self.stages[name]
+
+    # ---------- admission ----------
+    def backlog(self):
+        return sum(len(q) for q in self.waiting.values())
+
+    def reject_reason(self, uid: int):
+        """
+        None => job may be queued, else the text shown to the user
+        """
+        mine = len(self.waiting.get(uid, ())) + self.active.get(uid, 0)
+        if mine >= self.per_user:
+            return f"🚦 You already have {mine} jobs running/queued.\n\nWait for them to finish, then try again ✅"
+        if self.backlog() >= self.max_backlog and self.running >= self.max_active:
+            return "🚦 Bot is busy right now (queue full).\n\nTry again in a few minutes ✅"
+        return None
+
+    def _rotation(self):
+        """
+        waiting users, least recently served first (= round-robin)
+        """
+        return sorted(self.waiting, key=lambda u: self.served.get(u, -1))
+
+    def position(self, uid: int, fut):
+        """
+        1-based turn of `fut` under round-robin (0 = not waiting)
+        """
+        q = self.waiting.get(uid)
+        if not q or fut not in q:
+            return 0
+        idx = q.index(fut)
+        ahead = idx
+        before_me = True
+        for other in self._rotation():
+            if other == uid:
+                before_me = False
+                continue
+            ahead += min(len(self.waiting[other]), idx + 1 if before_me else idx)
+        return ahead + 1
+
+    def _pick(self):
+        for uid in self._rotation():
+            if self.active.get(uid, 0) >= self.user_active:
+                continue
+            q = self.waiting[uid]
+            fut = q.popleft()
+            if not q:
+                self.waiting.pop(uid, None)
+            self._turn += 1
+            self.served[uid] = self._turn
+            return uid, fut
+        return None
+
+    def _wake(self):
+        while self.running < self.max_active:
+            picked = self._pick()
+            if not picked:
+                return
+            uid, fut = picked
+            if fut.done():
+                continue
+            self.running += 1
+            self.active[uid] = self.active.get(uid, 0) + 1
+            fut.set_result(True)
+
+    def _release(self, uid: int):
+        self.running -= 1
+        n = self.active.get(uid, 0) - 1
+        if n > 0:
+            self.active[uid] = n
+        else:
+            self.active.pop(uid, None)
+            if uid not in self.waiting:
+                self.served.pop(uid, None)
+        self._wake()
+
+    def _drop_waiter(self, uid: int, fut):
+        q = self.waiting.get(uid)
+        if q is None:
+            return
+        try:
+            q.remove(fut)
+        except ValueError:
+            pass
+        if not q:
+            self.waiting.pop(uid, None)
+
+    async def _wait_turn(self, uid: int, fut, on_queue):
+        last = None
+        try:
+            while not fut.done():
+                pos = self.position(uid, fut)
+                if on_queue and pos and pos != last:
+                    last = pos
+                    await on_queue(pos)
+                await asyncio.wait([fut], timeout=2)
+        except:
+            if fut.done() and not fut.cancelled():
+                # admitted right as we got cancelled => pass the turn on
+                self._release(uid)
+            else:
+                fut.cancel()
+                self._drop_waiter(uid, fut)
+            raise
+
+    @asynccontextmanager
+    async def admit(self, uid: int, on_queue=None):
+        reason = self.reject_reason(uid)
+        if reason:
+            raise SchedulerFull(reason)
+
+        fut = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(uid, deque()).append(fut)
+        self._wake()
+        if not fut.done():
+            await self._wait_turn(uid, fut, on_queue)
+
+        try:
+            yield
+        finally:
+            self._release(uid)
+
+    async def run(self, uid: int, job, on_queue=None, on_reject=None):
+        """
+        job() -> coroutine, started once admitted
+        """
+        try:
+            async with self.admit(uid, on_queue):
+                return await job()
+        except SchedulerFull as e:
+            if on_reject:
+                await on_reject(str(e))
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "max_active": self.max_active,
+            "backlog": self.backlog(),
+            "users_waiting": len(self.waiting),
+            "stages": {name: g.stats() for name, g in self.stages.items()},
+        }
+
+
+def queued_text(pos: int) -> str:
+    return (
+        "🕒 Queued ✅\n\n"
+        f"Position: **#{pos}**\n\n"
+        "⏳ Starts automatically when a slot is free..."
+    )
+
+
+SCHEDULER = Scheduler(JOBS_MAX_ACTIVE, JOBS_MAX_BACKLOG, JOBS_PER_USER, JOBS_USER_ACTIVE)
+DOWNLOAD_GATE = SCHEDULER.register_stage("download", DOWNLOAD_SLOTS)
+UPLOAD_GATE = SCHEDULER.register_stage("upload", UPLOAD_SLOTS)
@@ -0,0 +1,185 @@
+import asyncio
+from functools import partial
+from collections import OrderedDict
+
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from pyrogram.errors import FloodWait
+
+from progress import PROGRESS
+from metrics import FLOODWAIT_SECONDS
+from tasks import TASKS
+
+
+# ===============================
+# Single-flight: one download per canonical URL ✅
+# ===============================
+# - first requester starts the job (leader), later ones attach to it
+# - every attached request (user + own status message) is fed from shared
+#   progress; the same user may be attached twice (double-tapped button)
+# - upload goes to the first still-attached user, others get a file_id resend
+# - cancel => that user detaches; the job only stops when nobody is left
+
+FLIGHTS = {}    # key -> Flight
+
+
+def sub_key(uid: int, status_msg):
+    """
+    one subscription per status message (not per user)
+    """
+    return (uid, getattr(status_msg, "id", None))
+
+
+def _kb_for(uid: int, kb):
+    """
+    same buttons, but cancel_<x> => cancel_<uid> of this subscriber
+    """
+    if not isinstance(kb, InlineKeyboardMarkup):
+        return kb
+    rows = []
+    for row in kb.inline_keyboard:
+        new_row = []
+        for b in row:
+            if (b.callback_data or "").startswith("cancel_"):
+                b = InlineKeyboardButton(b.text, callback_data=f"cancel_{uid}")
+            new_row.append(b)
+        rows.append(new_row)
+    return InlineKeyboardMarkup(rows)
+
+
+class FlightStatus:
+    """
+    Drop-in for a status Message (job code calls .edit / progress.publish)
+    => fans out to every subscriber's own message
+    """
+
+    def __init__(self, flight):
+        self.flight = flight
+
+    async def edit(self, text, reply_markup=None):
+        self.flight.last = (text, reply_markup)
+        subs = list(self.flight.subs.values())
+        await asyncio.gather(*[PROGRESS.edit(s["status"], text, _kb_for(s["uid"], reply_markup)) for s in subs])
+
+    def publish(self, render, *args, reply_markup=None):
+        # rendered lazily (late joiner / flush), not on every publish
+        self.flight.last = (partial(render, *args), reply_markup)
+        for s in self.flight.subs.values():
+            PROGRESS.publish(s["status"], render, args, _kb_for(s["uid"], reply_markup))
+
+
+class Flight:
+    def __init__(self, key: str):
+        self.key = key
+        self.subs = OrderedDict()   # sub_key -> {"uid", "chat_id", "status"}
+        self.delivered = set()      # uids that already have the media
+        self.task = None            # leader job
+        self.last = None            # last (text, kb) for late joiners
+        self.closed = False         # delivery started => no new joiners
+        self.status = FlightStatus(self)
+
+    def attach(self, uid: int, chat_id: int, status_msg):
+        key = sub_key(uid, status_msg)
+        self.subs[key] = {"uid": uid, "chat_id": chat_id, "status": status_msg}
+        return key
+
+    def detach(self, key):
+        self.subs.pop(key, None)
+        if not self.subs and self.task and not self.task.done():
+            # via registry => cancel event + child processes, not only the task
+            TASKS.cancel_task(self.task)
+
+    def upload_target(self):
+        """
+        (uid, chat_id) that receives the real upload
+        """
+        for s in self.subs.values():
+            if s["uid"] not in self.delivered:
+                return s["uid"], s["chat_id"]
+        raise asyncio.CancelledError
+
+    async def deliver(self, client, file_id: str, caption: str):
+        """
+        ✅ file_id resend to every attached user that has no copy yet
+        (users joining after this point start their own flight, which
+        finds the file_id in the cache)
+        """
+        self.closed = True
+        if not file_id:
+            return
+        for s in list(self.subs.values()):
+            uid = s["uid"]
+            if uid in self.delivered:
+                continue
+            try:
+                await client.send_cached_media(chat_id=s["chat_id"], file_id=file_id, caption=caption)
+                self.delivered.add(uid)
+            except FloodWait as e:
+                FLOODWAIT_SECONDS.inc(int(e.value), source="send")
+                await asyncio.sleep(int(e.value) + 1)
+                try:
+                    await client.send_cached_media(chat_id=s["chat_id"], file_id=file_id, caption=caption)
+                    self.delivered.add(uid)
+                except:
+                    pass
+            except:
+                pass
+
+
+async def join_or_start(key: str, uid: int, chat_id: int, status_msg, start_job):
+    """
+    start_job(flight) -> coroutine (leader only)
+    returns (flight, is_leader)
+    """
+    flight = FLIGHTS.get(key)
+    if flight and flight.task and not flight.task.done() and not flight.closed:
+        flight.attach(uid, chat_id, status_msg)
+        if flight.last:
+            text, kb = flight.last
+            text = text() if callable(text) else text
+            await PROGRESS.edit(status_msg, f"🤝 Same link already in progress, joined it ✅\n\n{text}", _kb_for(uid, kb))
+        return flight, False
+
+    flight = Flight(key)
+    flight.attach(uid, chat_id, status_msg)
+    flight.task = asyncio.create_task(start_job(flight))
+    FLIGHTS[key] = flight
+
+    def _cleanup(_t):
+        if FLIGHTS.get(key) is flight:
+            FLIGHTS.pop(key, None)
+
+    flight.task.add_done_callback(_cleanup)
+    return flight, True
+
+
+async def follow(flight, key):
+    """
+    Task of an attached (non-leader) request: waits for the shared job.
+    Cancelled => detach only this subscription (key = sub_key).
+    """
+    try:
+        await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        flight.detach(key)
+        raise
+    except:
+        pass
+
+
+def detach_user(uid: int, message_id=None):
+    """
+    ✅ Cancel button: if others share this user's job, only detach.
+    message_id => only the flight behind that status message
+    returns the Flight that keeps running for others (else None)
+    """
+    for flight in list(FLIGHTS.values()):
+        if len(flight.subs) < 2:
+            continue
+        for key, sub in list(flight.subs.items()):
+            if sub["uid"] != uid:
+                continue
+            if message_id is not None and key[1] != message_id:
+                continue
+            flight.detach(key)
+            return flight
+    return None
@@ -1,3 +1,11 @@
 #!/bin/bash
 python3 bot.py &
-gunicorn web:app --bind 0.0.0.0:$PORT
+BOT_PID=$!
+
+# ✅ platform stop/restart => bot gets SIGTERM too: unfinished jobs are kept
+# in DATA_DIR/state.sqlite3 and resumed by the next start
+trap 'kill -TERM $BOT_PID $WEB_PID 2>/dev/null; wait $BOT_PID' TERM INT
+
+gunicorn web:app --bind 0.0.0.0:$PORT &
+WEB_PID=$!
+wait $WEB_PID
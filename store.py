@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import sqlite3
+
+from config import DATA_DIR, STATE_DB, RESUME_MAX_AGE
+
+ALL_CACHES = {}     # table -> FileIdCache (for stats export)
+
+
+# ===============================
+# Persistent Telegram file_id cache (SQLite) ✅
+# ===============================
+class FileIdCache:
+    """
+    key -> Telegram file_id (+ small meta dict)
+    - entries older than `ttl` seconds are misses (and removed)
+    - at most `max_entries` rows, least recently used evicted first
+    - hits / misses counted for sizing
+    """
+
+    def __init__(self, db_path: str, table: str, ttl: int, max_entries: int):
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        ALL_CACHES[table] = self
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, file_id TEXT NOT NULL, meta TEXT, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_lru ON {self.table}(last_used)")
+        return self._db
+
+    def get(self, key: str):
+        """
+        returns {"file_id", "meta"} or None
+        """
+        try:
+            db = self._conn()
+            row = db.execute(f"SELECT file_id, meta, created FROM {self.table} WHERE key=?", (key,)).fetchone()
+            now = time.time()
+            if row and now - row[2] <= self.ttl:
+                db.execute(f"UPDATE {self.table} SET last_used=? WHERE key=?", (now, key))
+                self.hits += 1
+                return {"file_id": row[0], "meta": json.loads(row[1] or "{}")}
+            if row:
+                db.execute(f"DELETE FROM {self.table} WHERE key=?", (key,))
+        except:
+            pass
+        self.misses += 1
+        return None
+
+    def put(self, key: str, file_id: str, meta: dict = None):
+        if not key or not file_id:
+            return
+        try:
+            db = self._conn()
+            now = time.time()
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, file_id, meta, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, file_id, json.dumps(meta or {}), now, now)
+            )
+            self._evict(db, now)
+        except:
+            pass
+
+    def delete(self, key: str):
+        try:
+            self._conn().execute(f"DELETE FROM {self.table} WHERE key=?", (key,))
+        except:
+            pass
+
+    def _evict(self, db, now: float):
+        db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+        (count,) = db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            db.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def media_file_id(msg):
+    """
+    file_id of whatever Telegram stored (video may come back as document/animation)
+    """
+    if not msg:
+        return None
+    media = getattr(msg, "video", None) or getattr(msg, "document", None) or getattr(msg, "animation", None)
+    return media.file_id if media else None
+
+
+def cache_stats():
+    return {name: c.stats() for name, c in ALL_CACHES.items()}
+
+
+# ===============================
+# Pending jobs + URL choices (SQLite) => survive a restart ✅
+# ===============================
+class JobStore:
+    """
+    - url_state: uid -> URL still waiting for the File/Video choice
+    - jobs: accepted jobs (queued or running) until they finish; bot.py
+      starts them again, in arrival order, after a restart
+    - rows older than `max_age` seconds are dropped instead of restored
+    """
+
+    def __init__(self, db_path: str, max_age: int):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.restored = 0
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS url_state ("
+                "uid INTEGER PRIMARY KEY, url TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "key TEXT PRIMARY KEY, kind TEXT NOT NULL, uid INTEGER NOT NULL, "
+                "chat_id INTEGER NOT NULL, status_id INTEGER NOT NULL, args TEXT, created REAL NOT NULL)"
+            )
+        return self._db
+
+    # ---------- URL choices ----------
+    def put_url(self, uid: int, url: str):
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO url_state (uid, url, created) VALUES (?, ?, ?)",
+                (uid, url, time.time())
+            )
+        except:
+            pass
+
+    def drop_url(self, uid: int):
+        try:
+            self._conn().execute("DELETE FROM url_state WHERE uid=?", (uid,))
+        except:
+            pass
+
+    def urls(self):
+        """
+        {uid: url} still young enough to be chosen
+        """
+        try:
+            db = self._conn()
+            db.execute("DELETE FROM url_state WHERE created < ?", (time.time() - self.max_age,))
+            return dict(db.execute("SELECT uid, url FROM url_state").fetchall())
+        except:
+            return {}
+
+    # ---------- jobs ----------
+    def add(self, key: str, kind: str, uid: int, chat_id: int, status_id: int, args: dict, created: float = None):
+        """
+        created => keep the original arrival time (job restored after a restart)
+        """
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO jobs (key, kind, uid, chat_id, status_id, args, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, uid, chat_id, status_id, json.dumps(args), created or time.time())
+            )
+        except:
+            pass
+
+    def done(self, key: str):
+        try:
+            self._conn().execute("DELETE FROM jobs WHERE key=?", (key,))
+        except:
+            pass
+
+    def pending(self):
+        """
+        unfinished jobs, oldest first
+        """
+        try:
+            db = self._conn()
+            db.execute("DELETE FROM jobs WHERE created < ?", (time.time() - self.max_age,))
+            rows = db.execute(
+                "SELECT key, kind, uid, chat_id, status_id, args, created FROM jobs ORDER BY created ASC"
+            ).fetchall()
+        except:
+            return []
+        return [
+            {
+                "key": r[0], "kind": r[1], "uid": r[2], "chat_id": r[3],
+                "status_id": r[4], "args": json.loads(r[5] or "{}"), "created": r[6],
+            }
+            for r in rows
+        ]
+
+    def stats(self):
+        try:
+            db = self._conn()
+            (jobs,) = db.execute("SELECT COUNT(*) FROM jobs").fetchone()
+            (urls,) = db.execute("SELECT COUNT(*) FROM url_state").fetchone()
+        except:
+            jobs = urls = 0
+        return {"pending": jobs, "url_choices": urls, "restored": self.restored}
+
+
+JOB_STORE = JobStore(STATE_DB, RESUME_MAX_AGE)
+
+
+# ===============================
+# Small JSON state files (bot.py -> web.py, different processes)
+# ===============================
+def write_state(name: str, data):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        path = os.path.join(DATA_DIR, name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except:
+        pass
+
+
+def write_text_state(name: str, text: str):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        path = os.path.join(DATA_DIR, name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except:
+        pass
+
+
+def read_text_state(name: str):
+    """
+    (text, mtime) or (None, 0)
+    """
+    try:
+        path = os.path.join(DATA_DIR, name)
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), os.path.getmtime(path)
+    except:
+        return None, 0
+
+
+def read_state(name: str):
+    try:
+        with open(os.path.join(DATA_DIR, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return None
@@ -0,0 +1,215 @@
+import os
+import time
+import signal
+import asyncio
+from contextlib import asynccontextmanager
+
+from metrics import STAGE_SECONDS
+from store import JOB_STORE
+
+
+# ===============================
+# Task registry (one per bot process) ✅
+# ===============================
+# - bot.py / url.py / insta.py all import THIS module (never `from bot import`:
+#   bot.py runs as __main__, a second import of it has its own globals)
+# - every job has a handle: cancel Event (no shared set to poll), child
+#   processes killed the moment cancel fires, current stage + timings
+# - TASKS[uid][status message id] => handle (cancel button targets one job)
+# - handle.record = JOB_STORE key: dropped when the job ends, kept when the
+#   bot shuts down (shutdown()) => job starts again after the restart
+
+
+def _kill_now(proc):
+    """
+    own process group (start_new_session=True) => whole group, so helpers
+    the tool spawned (aria2c, ffmpeg) die with it
+    """
+    if proc.returncode is not None:
+        return
+    try:
+        if os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class TaskHandle:
+    def __init__(self, uid: int, key, kind: str):
+        self.uid = uid
+        self.key = key              # status message id
+        self.kind = kind            # url_file / url_video / insta / follow
+        self.task = None
+        self.cancelled = asyncio.Event()
+        self.stage = "queued"
+        self.started = time.monotonic()
+        self.stage_since = self.started
+        self.timings = {}           # stage -> seconds spent
+        self.record = None          # JOB_STORE key (restored after restart)
+        self._procs = set()
+
+    # ---------- cancel ----------
+    def cancel(self):
+        """
+        event first (loops see it at once), then children, then the task
+        """
+        self.cancelled.set()
+        for proc in list(self._procs):
+            _kill_now(proc)
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise asyncio.CancelledError
+
+    @asynccontextmanager
+    async def child(self, proc):
+        """
+        proc killed by cancel() right away, and when the block exits early
+        (then reaped before leaving)
+        """
+        if self.cancelled.is_set():
+            _kill_now(proc)
+        self._procs.add(proc)
+        try:
+            yield proc
+        finally:
+            self._procs.discard(proc)
+            if proc.returncode is None:
+                _kill_now(proc)
+                await proc.wait()
+
+    # ---------- stage / timing ----------
+    def set_stage(self, stage: str):
+        if stage == self.stage:
+            return
+        self._close_stage()
+        self.stage = stage
+
+    def _close_stage(self):
+        now = time.monotonic()
+        spent = now - self.stage_since
+        self.timings[self.stage] = self.timings.get(self.stage, 0) + spent
+        STAGE_SECONDS.observe(spent, kind=self.kind, stage=self.stage)
+        self.stage_since = now
+
+    def info(self):
+        now = time.monotonic()
+        return {
+            "uid": self.uid,
+            "kind": self.kind,
+            "stage": self.stage,
+            "age": round(now - self.started, 1),
+            "stage_age": round(now - self.stage_since, 1),
+        }
+
+
+class TaskRegistry:
+    def __init__(self):
+        self.users = {}         # uid -> {key: TaskHandle}
+        self._by_task = {}      # asyncio.Task -> TaskHandle
+        self.closing = False    # shutdown() => jobs end, records stay
+
+    def open(self, uid: int, key, kind: str):
+        """
+        handle before the task exists (job code closes over it), bind() after
+        """
+        handle = TaskHandle(uid, key, kind)
+        self.users.setdefault(uid, {})[key] = handle
+        return handle
+
+    def bind(self, handle: TaskHandle, task):
+        handle.task = task
+        self._by_task[task] = handle
+        if handle.is_cancelled():
+            task.cancel()
+
+        def _done(_t):
+            self._by_task.pop(task, None)
+            self.release(handle.uid, handle.key, handle)
+            handle._close_stage()
+            self.forget(handle)
+
+        task.add_done_callback(_done)
+        return handle
+
+    def release(self, uid: int, key, handle=None):
+        """
+        drop from the user's list (job itself may keep running for others)
+        """
+        user = self.users.get(uid)
+        if not user or key not in user:
+            return None
+        if handle is not None and user[key] is not handle:
+            return None
+        h = user.pop(key)
+        if not user:
+            self.users.pop(uid, None)
+        return h
+
+    def forget(self, handle):
+        """
+        user is done with this job (finished / cancelled / detached) =>
+        not restored after a restart; kept while shutting down
+        """
+        if handle and handle.record and not self.closing:
+            JOB_STORE.done(handle.record)
+
+    def get(self, uid: int, key):
+        return self.users.get(uid, {}).get(key)
+
+    def busy(self, uid: int, key):
+        return self.get(uid, key) is not None
+
+    def cancel(self, uid: int, key=None):
+        """
+        key => that job only, else every job of the user; returns count
+        """
+        user = self.users.get(uid, {})
+        handles = [user[key]] if key in user else ([] if key is not None else list(user.values()))
+        for h in handles:
+            h.cancel()
+            self.forget(h)
+        return len(handles)
+
+    def cancel_task(self, task):
+        handle = self._by_task.get(task)
+        if handle:
+            handle.cancel()
+        elif not task.done():
+            task.cancel()
+
+    async def shutdown(self, timeout: float = 10):
+        """
+        stop every job for a restart: tasks cancelled (not handles => jobs
+        can tell a restart from the cancel button), children killed, pending
+        job records kept
+        """
+        self.closing = True
+        tasks = list(self._by_task)
+        for task, handle in list(self._by_task.items()):
+            for proc in list(handle._procs):
+                _kill_now(proc)
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def stats(self):
+        handles = list(self._by_task.values())
+        by_stage = {}
+        for h in handles:
+            by_stage[h.stage] = by_stage.get(h.stage, 0) + 1
+        return {
+            "running": len(handles),
+            "by_stage": by_stage,
+            "oldest": sorted((h.info() for h in handles), key=lambda i: -i["age"])[:20],
+        }
+
+
+TASKS = TaskRegistry()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# config.py reads the environment at import => state files go to a scratch dir
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bot_test_data_"))
+os.environ.setdefault("DOWNLOAD_DIR", tempfile.mkdtemp(prefix="bot_test_dl_"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+import pytest
+
+import tasks
+from store import JobStore
+from tasks import TaskRegistry
+
+
+@pytest.fixture
+def job_store(tmp_path, monkeypatch):
+    js = JobStore(str(tmp_path / "state.sqlite3"), 3600)
+    monkeypatch.setattr(tasks, "JOB_STORE", js)
+    return js
+
+
+def _keys(js):
+    return [r["key"] for r in js.pending()]
+
+
+def test_pending_in_arrival_order(job_store):
+    now = time.time()
+    job_store.add("b", "url", 1, 1, 2, {"url": "u"}, created=now - 10)
+    job_store.add("a", "url", 1, 1, 1, {"url": "u"}, created=now - 20)
+    job_store.add("old", "url", 1, 1, 3, {"url": "u"}, created=now - 7200)
+    assert _keys(job_store) == ["a", "b"]
+
+
+def test_url_choices_round_trip(job_store):
+    job_store.put_url(1, "http://a")
+    job_store.put_url(1, "http://b")
+    job_store.put_url(2, "http://c")
+    job_store.drop_url(2)
+    assert job_store.urls() == {1: "http://b"}
+
+
+def test_records_dropped_on_finish_and_cancel_kept_on_shutdown(job_store):
+    async def main():
+        reg = TaskRegistry()
+
+        def start(key, coro):
+            job_store.add(key, "url", 1, 1, key, {})
+            h = reg.open(1, key, "url_file")
+            h.record = key
+            reg.bind(h, asyncio.create_task(coro))
+            return h
+
+        start(1, asyncio.sleep(0))
+        start(2, asyncio.sleep(10))
+        start(3, asyncio.sleep(10))
+        await asyncio.sleep(0.01)
+        reg.cancel(1, 2)                # cancel button
+        await asyncio.sleep(0.01)
+        await reg.shutdown(1)           # restart
+        return _keys(job_store)
+
+    assert asyncio.run(main()) == ["3"]
+
+
+def test_forget_on_detach(job_store):
+    reg = TaskRegistry()
+    job_store.add("x", "url", 1, 1, 5, {})
+    h = reg.open(1, 5, "url_file")
+    h.record = "x"
+    reg.forget(reg.release(1, 5))
+    assert _keys(job_store) == []
@@ -0,0 +1,55 @@
+from media import _parse_probe, KEYFRAME_WINDOW, VIDEO_MAX_KEYINT
+
+
+def _data(duration, packets):
+    return {
+        "format": {"duration": str(duration)},
+        "streams": [{"index": 0, "codec_type": "video", "codec_name": "h264", "pix_fmt": "yuv420p"}],
+        "packets": packets,
+    }
+
+
+def _packets(seconds, key_every, fps=10):
+    return [
+        {"stream_index": 0, "pts_time": str(i / fps), "flags": "K_" if i % (key_every * fps) == 0 else "__"}
+        for i in range(int(seconds * fps))
+    ]
+
+
+def test_head_probe_judges_only_seen_span():
+    # stream head longer than VIDEO_MAX_KEYINT of a 10 min file, keyframe every 2s
+    info = _parse_probe(_data(600, _packets(VIDEO_MAX_KEYINT + 2, 2)))
+    assert info.max_keyint == 2.0
+    assert info.keyint_known
+
+
+def test_short_head_with_one_keyframe_is_inconclusive():
+    # 4s head of a stream with 60s between keyframes
+    info = _parse_probe(_data(600, _packets(4, 60)))
+    assert not info.keyint_known
+
+
+def test_short_head_below_max_keyint_is_inconclusive():
+    info = _parse_probe(_data(600, _packets(VIDEO_MAX_KEYINT - 3, 2)))
+    assert not info.keyint_known
+
+
+def test_short_complete_file_is_judged():
+    # whole 5s clip scanned => not truncated, nothing unknown
+    info = _parse_probe(_data(5, _packets(5, 2)))
+    assert info.keyint_known
+
+
+def test_full_window_tail_without_keyframe_counts():
+    info = _parse_probe(_data(600, _packets(KEYFRAME_WINDOW, KEYFRAME_WINDOW)))
+    assert info.max_keyint > KEYFRAME_WINDOW - 1
+
+
+def test_regular_keyframes_over_full_window():
+    info = _parse_probe(_data(600, _packets(KEYFRAME_WINDOW, 2)))
+    assert info.max_keyint == 2.0
+    assert info.ok and info.vcodec == "h264" and info.duration == 600
+
+
+def test_no_packets_falls_back_to_window():
+    assert _parse_probe(_data(10, [])).max_keyint == 10
@@ -0,0 +1,51 @@
+import time
+import asyncio
+
+from pyrogram.errors import FloodWait
+
+from progress import ProgressHub
+
+
+class _Chat:
+    id = 1
+
+
+class _Msg:
+    def __init__(self, mid, floods=0):
+        self.id = mid
+        self.chat = _Chat()
+        self.floods = floods
+        self.sent = []
+
+    async def edit(self, text, reply_markup=None):
+        if self.floods:
+            self.floods -= 1
+            raise FloodWait(value=0)
+        self.sent.append((time.monotonic(), text))
+
+
+def test_direct_edits_share_the_rate_budget():
+    async def main():
+        hub = ProgressHub(rate=20, rate_min=1, rate_max=20, interval=3)
+        msgs = [_Msg(i) for i in range(5)]
+        await asyncio.gather(*(hub.edit(m, "Queue position: #2") for m in msgs))
+        return sorted(m.sent[0][0] for m in msgs)
+
+    times = asyncio.run(main())
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # 20 edits/sec => about 50 ms apart, never a burst
+    assert all(g >= 0.04 for g in gaps)
+
+
+def test_final_text_survives_floodwait():
+    async def main():
+        hub = ProgressHub(rate=20, rate_min=1, rate_max=20, interval=0)
+        msg = _Msg(1, floods=3)
+        await hub.edit(msg, "✅ Done ✅")
+        for _ in range(100):
+            if msg.sent:
+                break
+            await asyncio.sleep(0.05)
+        return [t for _, t in msg.sent]
+
+    assert asyncio.run(main()) == ["✅ Done ✅"]
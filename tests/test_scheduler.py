@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from scheduler import Scheduler, SchedulerFull, StageGate
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_round_robin_across_users():
+    async def main():
+        sched = Scheduler(max_active=1, max_backlog=10, per_user=5, user_active=5)
+        order = []
+        done = {n: asyncio.Event() for n in ("a1", "a2", "a3", "b1")}
+
+        async def submit(uid, name):
+            async with sched.admit(uid):
+                order.append(name)
+                await done[name].wait()
+
+        tasks = [asyncio.create_task(submit(1, "a1"))]
+        await _settle()
+        tasks += [asyncio.create_task(submit(1, n)) for n in ("a2", "a3")]
+        await _settle()
+        tasks.append(asyncio.create_task(submit(2, "b1")))
+        await _settle()
+
+        while len(order) < 4 or not all(t.done() for t in tasks):
+            done[order[-1]].set()
+            await _settle()
+        return order
+
+    # user 2 is served before user 1's second job
+    assert run(main()) == ["a1", "b1", "a2", "a3"]
+
+
+def test_position_follows_rotation():
+    async def main():
+        sched = Scheduler(max_active=1, max_backlog=10, per_user=5, user_active=5)
+        hold = asyncio.Event()
+
+        async def submit(uid):
+            async with sched.admit(uid):
+                await hold.wait()
+
+        tasks = [asyncio.create_task(submit(1))]
+        await _settle()
+        tasks += [asyncio.create_task(submit(1)), asyncio.create_task(submit(1))]
+        await _settle()
+        tasks.append(asyncio.create_task(submit(2)))
+        await _settle()
+
+        a2, a3 = sched.waiting[1]
+        (b1,) = sched.waiting[2]
+        positions = (sched.position(2, b1), sched.position(1, a2), sched.position(1, a3))
+        hold.set()
+        await asyncio.gather(*tasks)
+        return positions
+
+    assert run(main()) == (1, 2, 3)
+
+
+def test_per_user_limit_rejects():
+    async def main():
+        sched = Scheduler(max_active=1, max_backlog=10, per_user=2, user_active=1)
+        hold = asyncio.Event()
+
+        async def submit(uid):
+            async with sched.admit(uid):
+                await hold.wait()
+
+        tasks = [asyncio.create_task(submit(1)) for _ in range(2)]
+        await _settle()
+        with pytest.raises(SchedulerFull):
+            async with sched.admit(1):
+                pass
+        # other users are not affected
+        assert sched.reject_reason(2) is None
+        hold.set()
+        await asyncio.gather(*tasks)
+
+    run(main())
+
+
+def test_full_backlog_rejects():
+    async def main():
+        sched = Scheduler(max_active=1, max_backlog=1, per_user=5, user_active=5)
+        hold = asyncio.Event()
+
+        async def submit(uid):
+            async with sched.admit(uid):
+                await hold.wait()
+
+        tasks = [asyncio.create_task(submit(1)), asyncio.create_task(submit(2))]
+        await _settle()
+        assert sched.running == 1 and sched.backlog() == 1
+        assert sched.reject_reason(3) is not None
+
+        rejected = []
+        await sched.run(3, lambda: asyncio.sleep(0), on_reject=lambda r: _append(rejected, r))
+        assert rejected
+        hold.set()
+        await asyncio.gather(*tasks)
+
+    async def _append(lst, item):
+        lst.append(item)
+
+    run(main())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        sched = Scheduler(max_active=1, max_backlog=10, per_user=5, user_active=5)
+        hold = asyncio.Event()
+
+        async def submit(uid):
+            async with sched.admit(uid):
+                await hold.wait()
+
+        first = asyncio.create_task(submit(1))
+        await _settle()
+        waiter = asyncio.create_task(submit(2))
+        await _settle()
+        assert sched.backlog() == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert sched.backlog() == 0 and 2 not in sched.waiting
+
+        hold.set()
+        await first
+        assert sched.running == 0
+
+    run(main())
+
+
+def test_stage_gate_fifo_and_limit():
+    async def main():
+        gate = StageGate(1)
+        order = []
+        release = [asyncio.Event() for _ in range(3)]
+
+        async def use(i):
+            async with gate.slot():
+                order.append(i)
+                await release[i].wait()
+
+        tasks = [asyncio.create_task(use(i)) for i in range(3)]
+        await _settle()
+        assert order == [0] and gate.queued() == 2
+        for ev in release:
+            ev.set()
+            await _settle()
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2] and gate.active == 0
+
+    run(main())
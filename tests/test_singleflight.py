@@ -0,0 +1,96 @@
+import asyncio
+
+import singleflight
+from singleflight import join_or_start
+
+
+class _Client:
+    def __init__(self):
+        self.sent = []
+
+    async def send_cached_media(self, chat_id, file_id, caption):
+        self.sent.append(chat_id)
+
+
+def test_join_after_delivery_starts_new_flight(monkeypatch):
+    async def noop_edit(*a, **k):
+        pass
+
+    monkeypatch.setattr(singleflight.PROGRESS, "edit", noop_edit)
+
+    async def main():
+        client = _Client()
+        delivered = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def leader(flight):
+            await flight.deliver(client, "FILE", "cap")
+            delivered.set()
+            await finish.wait()     # Done edit / cleanup still running
+
+        first, lead = await join_or_start("k", 1, 100, object(), leader)
+        assert lead
+        await delivered.wait()
+
+        second, lead2 = await join_or_start("k", 2, 200, object(), lambda f: asyncio.sleep(0))
+        finish.set()
+        await asyncio.gather(first.task, second.task)
+        return lead2, second is first
+
+    lead2, same = asyncio.run(main())
+    assert lead2 and not same
+
+
+def test_join_before_delivery_gets_media(monkeypatch):
+    async def noop_edit(*a, **k):
+        pass
+
+    monkeypatch.setattr(singleflight.PROGRESS, "edit", noop_edit)
+
+    async def main():
+        client = _Client()
+        go = asyncio.Event()
+
+        async def leader(flight):
+            await go.wait()
+            await flight.deliver(client, "FILE", "cap")
+
+        first, _ = await join_or_start("k2", 1, 100, object(), leader)
+        _, lead2 = await join_or_start("k2", 2, 200, object(), leader)
+        go.set()
+        await first.task
+        return lead2, client.sent
+
+    lead2, sent = asyncio.run(main())
+    assert not lead2 and sent == [100, 200]
+
+
+class _Status:
+    def __init__(self, mid):
+        self.id = mid
+
+
+def test_same_user_twice_keeps_both_subscriptions(monkeypatch):
+    async def noop_edit(*a, **k):
+        pass
+
+    monkeypatch.setattr(singleflight.PROGRESS, "edit", noop_edit)
+
+    async def main():
+        go = asyncio.Event()
+
+        async def leader(flight):
+            await go.wait()
+
+        first, _ = await join_or_start("k3", 1, 100, _Status(10), leader)
+        again, lead2 = await join_or_start("k3", 1, 100, _Status(11), leader)
+        assert again is first and not lead2
+        assert len(first.subs) == 2
+
+        # cancel on the first status => only that subscription leaves
+        assert singleflight.detach_user(1, 10) is first
+        assert list(first.subs) == [(1, 11)] and not first.task.done()
+        go.set()
+        await first.task
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import store
+from store import FileIdCache
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(tmp_path, monkeypatch, ttl=100, max_entries=10, table="t"):
+    clock = _Clock()
+    monkeypatch.setattr(store.time, "time", clock)
+    return FileIdCache(str(tmp_path / "cache.sqlite3"), table, ttl, max_entries), clock
+
+
+def test_put_get_round_trip(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    cache.put("k", "FILE", {"name": "a.mp4", "size": 3})
+    assert cache.get("k") == {"file_id": "FILE", "meta": {"name": "a.mp4", "size": 3}}
+    assert cache.get("missing") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_expired_entry_is_a_miss_and_removed(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl=100)
+    cache.put("k", "FILE")
+    clock.now += 100
+    assert cache.get("k") is not None
+    clock.now += 1
+    assert cache.get("k") is None
+    # gone for good, not just hidden
+    clock.now -= 50
+    assert cache.get("k") is None
+
+
+def test_hits_do_not_extend_ttl(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl=100)
+    cache.put("k", "FILE")
+    for _ in range(3):
+        clock.now += 40
+        cache.get("k")
+    assert cache.get("k") is None
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, max_entries=2)
+    cache.put("a", "A")
+    clock.now += 1
+    cache.put("b", "B")
+    clock.now += 1
+    cache.get("a")          # a is now the most recently used
+    clock.now += 1
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a")["file_id"] == "A"
+    assert cache.get("c")["file_id"] == "C"
+
+
+def test_delete_and_empty_values(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    cache.put("", "X")
+    cache.put("k", "")
+    assert cache.get("") is None and cache.get("k") is None
+
+    cache.put("k", "FILE")
+    cache.delete("k")
+    assert cache.get("k") is None
+
+
+def test_tables_are_independent(tmp_path, monkeypatch):
+    a, _ = _cache(tmp_path, monkeypatch, table="one")
+    b = FileIdCache(str(tmp_path / "cache.sqlite3"), "two", 100, 10)
+    a.put("k", "A")
+    assert b.get("k") is None
+    assert "one" in store.cache_stats() and "two" in store.cache_stats()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from pyrogram.errors import FloodWait
+
+import uploader
+from uploader import PartUploader, PART_SIZE
+
+
+class _Session:
+    def __init__(self, script):
+        self.script = list(script)      # per call: None = ok, else exception
+        self.calls = 0
+
+    async def invoke(self, rpc):
+        self.calls += 1
+        err = self.script.pop(0) if self.script else None
+        if err:
+            raise err
+
+
+class _Pool:
+    def __init__(self, session):
+        self.session = session
+
+    async def get(self, client):
+        return self.session
+
+
+class _Client:
+    def rnd_id(self):
+        return 1
+
+
+@pytest.fixture(autouse=True)
+def _no_sleep(monkeypatch):
+    real_sleep = asyncio.sleep
+
+    async def fast(_seconds):
+        await real_sleep(0)
+
+    monkeypatch.setattr(uploader.asyncio, "sleep", fast)
+
+
+async def _upload(session, size=PART_SIZE):
+    up = PartUploader(_Client(), size, "f.bin", workers=1, pool=_Pool(session))
+    await up.start()
+    try:
+        await up.feed(b"x" * size)
+        return await up.finish()
+    finally:
+        await up.close()
+
+
+def test_floodwait_does_not_use_up_retries():
+    floods = [FloodWait(value=1)] * (uploader.PART_RETRIES + 2)
+    session = _Session(floods)
+    f = asyncio.run(_upload(session))
+    assert f.parts == 1
+    assert session.calls == len(floods) + 1
+
+
+def test_exhausted_retries_fail_the_upload():
+    session = _Session([RuntimeError("boom")] * (uploader.PART_RETRIES + 1))
+    with pytest.raises(Exception, match="Upload failed"):
+        asyncio.run(_upload(session))
+
+
+def test_transient_error_is_retried():
+    session = _Session([RuntimeError("boom"), None])
+    assert asyncio.run(_upload(session)).parts == 1
@@ -0,0 +1,146 @@
+import json
+
+import url
+from url import (
+    _holes, _plan_segments, _completed, _range_total,
+    save_manifest, load_manifest, has_partial, drop_partial,
+)
+
+
+class _Resp:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+MiB = 1024 * 1024
+
+
+# ---------- holes ----------
+def test_holes_empty_done_is_whole_file():
+    assert _holes([], 100) == [[0, 99]]
+
+
+def test_holes_between_and_after_done_ranges():
+    assert _holes([[10, 19], [40, 49]], 100) == [[0, 9], [20, 39], [50, 99]]
+
+
+def test_holes_unsorted_and_overlapping():
+    assert _holes([[40, 60], [0, 9], [5, 45]], 100) == [[61, 99]]
+
+
+def test_holes_complete_file():
+    assert _holes([[0, 99]], 100) == []
+
+
+# ---------- segments ----------
+def test_plan_segments_cover_holes_exactly(monkeypatch):
+    monkeypatch.setattr(url, "URL_SEGMENTS", 4)
+    monkeypatch.setattr(url, "URL_SEGMENT_MIN_SIZE", MiB)
+    holes = [[0, 8 * MiB - 1], [10 * MiB, 11 * MiB - 1]]
+    segs = _plan_segments(holes)
+
+    assert len(segs) == 4
+    covered = sorted(segs)
+    # contiguous, no overlap, nothing outside the holes
+    assert _holes(covered, 11 * MiB) == [[8 * MiB, 10 * MiB - 1]]
+    assert sum(e - s + 1 for s, e in segs) == 9 * MiB
+
+
+def test_plan_segments_bigger_hole_gets_more_connections(monkeypatch):
+    monkeypatch.setattr(url, "URL_SEGMENTS", 4)
+    monkeypatch.setattr(url, "URL_SEGMENT_MIN_SIZE", MiB)
+    segs = _plan_segments([[0, 8 * MiB - 1], [10 * MiB, 11 * MiB - 1]])
+    in_big = [s for s in segs if s[1] < 8 * MiB]
+    assert len(in_big) == 3
+
+
+def test_plan_segments_respects_min_size(monkeypatch):
+    monkeypatch.setattr(url, "URL_SEGMENTS", 8)
+    monkeypatch.setattr(url, "URL_SEGMENT_MIN_SIZE", MiB)
+    segs = _plan_segments([[0, 2 * MiB - 1]])
+    assert len(segs) == 2
+    assert all(e - s + 1 >= MiB for s, e in segs)
+
+
+def test_completed_is_complement_of_remaining_work():
+    # remaining [pos, end] per segment => bytes already written
+    segs = [[50, 99], [150, 199], [200, 199]]
+    assert _completed(segs, 200) == [[0, 49], [100, 149]]
+
+
+# ---------- Content-Range ----------
+def test_range_total_parses_header():
+    assert _range_total(_Resp({"Content-Range": "bytes 100-199/1000"})) == (100, 1000)
+
+
+def test_range_total_missing_or_garbage():
+    assert _range_total(_Resp({})) == (None, 0)
+    assert _range_total(_Resp({"Content-Range": "bytes */1000x"})) == (None, 0)
+
+
+# ---------- manifest (resume) ----------
+def _partial(tmp_path, total=100):
+    path = str(tmp_path / "f.part")
+    with open(path, "wb") as f:
+        f.truncate(total)
+    return path
+
+
+def test_manifest_round_trip(tmp_path):
+    path = _partial(tmp_path)
+    m = {"url": "http://x/a", "total": 100, "done": [[0, 49]]}
+    save_manifest(path, m)
+
+    assert has_partial(path)
+    assert load_manifest(path, "http://x/a") == m
+    # resume continues with the holes only
+    assert _holes(m["done"], m["total"]) == [[50, 99]]
+
+
+def test_manifest_other_url_is_ignored(tmp_path):
+    path = _partial(tmp_path)
+    save_manifest(path, {"url": "http://x/a", "total": 100, "done": []})
+    assert load_manifest(path, "http://x/b") is None
+
+
+def test_manifest_size_mismatch_is_ignored(tmp_path):
+    path = _partial(tmp_path, total=80)
+    save_manifest(path, {"url": "http://x/a", "total": 100, "done": []})
+    assert load_manifest(path, "http://x/a") is None
+
+
+def test_manifest_corrupt_is_ignored(tmp_path):
+    path = _partial(tmp_path)
+    with open(path + ".part.json", "w") as f:
+        f.write("{not json")
+    assert load_manifest(path, "http://x/a") is None
+
+
+def test_drop_partial_removes_both_files(tmp_path):
+    path = _partial(tmp_path)
+    save_manifest(path, {"url": "u", "total": 100, "done": []})
+    drop_partial(path)
+    assert not has_partial(path)
+    assert not (tmp_path / "f.part").exists()
+    assert not (tmp_path / "f.part.json").exists()
+
+
+def test_save_manifest_is_plain_json(tmp_path):
+    path = _partial(tmp_path)
+    save_manifest(path, {"url": "u", "total": 100, "done": [[0, 9]]})
+    with open(path + ".part.json") as f:
+        assert json.load(f)["done"] == [[0, 9]]
+
+
+def test_complete_manifest_finishes_without_request(tmp_path):
+    import asyncio
+    from url import _download_attempt
+
+    path = _partial(tmp_path)
+    m = {"url": "http://x/a", "total": 100, "done": [[0, 49], [50, 99]]}
+    save_manifest(path, m)
+    st = {"manifest": load_manifest(path, "http://x/a"), "segs": None, "total": 100}
+
+    # session=None => any request would raise
+    asyncio.run(_download_attempt(None, "http://x/a", path, 1, None, st))
+    assert st["manifest"] == m
@@ -0,0 +1,73 @@
+import asyncio
+
+import url
+from media import Capabilities, MediaInfo
+
+FULL = Capabilities(ffmpeg="ffmpeg", ffprobe="ffprobe", encoders=frozenset({"libx264", "aac"}))
+NO_X264 = Capabilities(ffmpeg="ffmpeg", ffprobe="ffprobe", encoders=frozenset({"aac"}))
+
+
+def _setup(monkeypatch, tmp_path, results, caps=FULL):
+    src = tmp_path / "in.mp4"
+    src.write_bytes(b"x" * 100)
+    calls = []
+
+    async def fake_run(input_path, out_path, plan, on_queue=None):
+        calls.append(plan)
+        code = results[len(calls) - 1]
+        with open(out_path, "wb") as f:
+            f.write(b"partial")     # ffmpeg leaves output even when it dies
+        return code, b""
+
+    async def has_ffmpeg():
+        return True
+
+    async def fake_caps():
+        return caps
+
+    monkeypatch.setattr(url, "capabilities", fake_caps)
+    monkeypatch.setattr(url, "_run_video_fix", fake_run)
+    monkeypatch.setattr(url, "_ffmpeg_exists", has_ffmpeg)
+    return str(src), calls
+
+
+def test_failed_remux_falls_back_to_encode(monkeypatch, tmp_path):
+    src, calls = _setup(monkeypatch, tmp_path, [1, 0])
+    path, used = asyncio.run(url.fix_streaming_seek(src, "remux"))
+    assert calls == ["remux", "encode"]
+    assert used == "encode" and path == src + "_seekfix.mp4"
+
+
+def test_all_plans_failing_keeps_input(monkeypatch, tmp_path):
+    src, calls = _setup(monkeypatch, tmp_path, [1, 1])
+    path, used = asyncio.run(url.fix_streaming_seek(src, "remux"))
+    assert (path, used) == (src, None)
+    assert (tmp_path / "in.mp4").exists()
+    assert not (tmp_path / "in.mp4_seekfix.mp4").exists()
+
+
+def test_missing_encoder_is_not_tried(monkeypatch, tmp_path):
+    src, calls = _setup(monkeypatch, tmp_path, [1], caps=NO_X264)
+    path, used = asyncio.run(url.fix_streaming_seek(src, "remux"))
+    assert calls == ["remux"]
+    assert (path, used) == (src, None)
+
+
+def _info(vcodec="h264", acodec="aac"):
+    return MediaInfo(vcodec=vcodec, pix_fmt="yuv420p", acodec=acodec, max_keyint=2, ok=True)
+
+
+def test_plan_uses_available_encoders():
+    assert url.plan_video_fix(_info(vcodec="hevc"), FULL) == "encode"
+    assert url.plan_video_fix(_info(acodec="opus"), FULL) == "audio"
+    assert url.plan_video_fix(_info(), FULL) == "remux"
+
+
+def test_plan_falls_back_to_remux_without_encoders():
+    no_aac = Capabilities(ffmpeg="ffmpeg", ffprobe="ffprobe", encoders=frozenset({"libx264"}))
+    assert url.plan_video_fix(_info(vcodec="hevc"), NO_X264) == "remux"
+    assert url.plan_video_fix(_info(acodec="opus"), no_aac) == "remux"
+
+
+def test_unknown_encoder_list_trusts_ffmpeg():
+    assert url.plan_video_fix(_info(vcodec="hevc"), Capabilities()) == "encode"
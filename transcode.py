@@ -0,0 +1,18 @@
+import os
+
+from config import TRANSCODE_SLOTS, TRANSCODE_THREADS
+from scheduler import SCHEDULER
+
+
+# ===============================
+# Transcode pool (CPU-aware)
+# ===============================
+CPU_COUNT = os.cpu_count() or 1
+
+# auto => half the cores run encodes, each encode gets an equal share of threads
+ENCODE_SLOTS = TRANSCODE_SLOTS if TRANSCODE_SLOTS > 0 else max(1, CPU_COUNT // 2)
+ENCODE_THREADS = TRANSCODE_THREADS if TRANSCODE_THREADS > 0 else max(1, CPU_COUNT // ENCODE_SLOTS)
+
+
+# ✅ FIFO encode slots, registered as the scheduler's "transcode" stage
+TRANSCODE_POOL = SCHEDULER.register_stage("transcode", ENCODE_SLOTS)
@@ -0,0 +1,276 @@
+import os
+import math
+import asyncio
+import mimetypes
+from hashlib import md5
+
+from pyrogram import raw, types, utils
+from pyrogram.errors import FloodWait, FilePartMissing
+from pyrogram.session import Session
+
+from config import UPLOAD_WORKERS, UPLOAD_BUFFER_PARTS, UPLOAD_SESSIONS
+from metrics import UPLOAD_BYTES, FLOODWAIT_SECONDS
+
+
+# ===============================
+# Telegram upload engine (raw MTProto parts) ✅
+# ===============================
+# - bytes are cut into 512 KiB parts: streamed while the download still runs,
+#   or read from disk (upload_path, replaces client.save_file)
+# - UPLOAD_SESSIONS media connections shared by every upload (started once,
+#   not per file); a job's UPLOAD_WORKERS part senders spread over them
+# - bounded queue (UPLOAD_BUFFER_PARTS) => memory stays flat, a slow upload
+#   slows the download down instead of buffering it
+# - total size must be known upfront (Telegram wants the part count)
+
+PART_SIZE = 512 * 1024
+BIG_FILE = 10 * 1024 * 1024
+PART_RETRIES = 3
+READ_SIZE = 8 * PART_SIZE      # disk reads per thread hop (upload_path)
+
+
+class SessionPool:
+    """
+    media sessions to our DC, started lazily, reused until shutdown
+    get() hands them out round-robin
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.sessions = []
+        self._next = 0
+        self._lock = asyncio.Lock()
+
+    async def get(self, client):
+        if len(self.sessions) < self.size:
+            async with self._lock:
+                while len(self.sessions) < self.size:
+                    session = Session(
+                        client, await client.storage.dc_id(), await client.storage.auth_key(),
+                        await client.storage.test_mode(), is_media=True
+                    )
+                    await session.start()
+                    self.sessions.append(session)
+        session = self.sessions[self._next % len(self.sessions)]
+        self._next += 1
+        return session
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            try:
+                await session.stop()
+            except:
+                pass
+
+    def stats(self):
+        return {"sessions": len(self.sessions), "size": self.size}
+
+
+UPLOAD_POOL = SessionPool(UPLOAD_SESSIONS)
+
+
+class PartUploader:
+    def __init__(self, client, total_size: int, file_name: str,
+                 workers: int = UPLOAD_WORKERS, buffer_parts: int = UPLOAD_BUFFER_PARTS,
+                 source: str = "url", pool: SessionPool = UPLOAD_POOL):
+        if total_size <= 0:
+            raise ValueError("Streaming upload needs a known size")
+        self.client = client
+        self.total_size = total_size
+        self.file_name = file_name
+        self.total_parts = int(math.ceil(total_size / PART_SIZE))
+        self.is_big = total_size > BIG_FILE
+        self.file_id = client.rnd_id()
+        self.uploaded = 0           # bytes confirmed by Telegram
+        self.error = None
+        self.source = source        # metrics label
+        self._md5 = None if self.is_big else md5()
+        self._buf = bytearray()
+        self._part = 0
+        self._queue = asyncio.Queue(max(1, buffer_parts))
+        self._workers_count = max(1, workers) if self.is_big else 1
+        self._workers = []
+        self._pool = pool
+
+    async def start(self):
+        sessions = [await self._pool.get(self.client) for _ in range(self._workers_count)]
+        self._workers = [asyncio.create_task(self._worker(session)) for session in sessions]
+
+    def _rpc(self, part: int, chunk: bytes):
+        if self.is_big:
+            return raw.functions.upload.SaveBigFilePart(
+                file_id=self.file_id, file_part=part,
+                file_total_parts=self.total_parts, bytes=chunk
+            )
+        return raw.functions.upload.SaveFilePart(file_id=self.file_id, file_part=part, bytes=chunk)
+
+    async def _worker(self, session):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if self.error:
+                continue    # keep draining so feed() never blocks on a dead upload
+
+            rpc, size = item
+            attempt = 0
+            while True:
+                try:
+                    await session.invoke(rpc)
+                    self.uploaded += size
+                    UPLOAD_BYTES.inc(size, source=self.source)
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except FloodWait as e:
+                    # rate limit, not a failure => does not use up a retry
+                    FLOODWAIT_SECONDS.inc(int(e.value), source="upload")
+                    await asyncio.sleep(int(e.value) + 1)
+                except Exception as e:
+                    if attempt >= PART_RETRIES:
+                        self.error = e      # never drop a part silently
+                        break
+                    await asyncio.sleep(2 ** attempt)
+                    attempt += 1
+
+    async def _put(self, chunk: bytes):
+        if self.error:
+            raise Exception(f"Upload failed: {self.error}")
+        if self._part >= self.total_parts:
+            raise Exception("More data than Content-Length")
+        if self._md5:
+            self._md5.update(chunk)
+        await self._queue.put((self._rpc(self._part, chunk), len(chunk)))
+        self._part += 1
+
+    async def feed(self, data: bytes):
+        self._buf += data
+        while len(self._buf) >= PART_SIZE:
+            chunk = bytes(self._buf[:PART_SIZE])
+            del self._buf[:PART_SIZE]
+            await self._put(chunk)
+
+    async def finish(self):
+        """
+        last part + wait for workers => InputFile / InputFileBig
+        """
+        if self._buf:
+            await self._put(bytes(self._buf))
+            self._buf.clear()
+        if self._part != self.total_parts:
+            raise Exception("Download ended early (size mismatch)")
+
+        for _ in self._workers:
+            await self._queue.put(None)
+        await asyncio.gather(*self._workers)
+        self._workers = []
+        if self.error:
+            raise Exception(f"Upload failed: {self.error}")
+
+        if self.is_big:
+            return raw.types.InputFileBig(id=self.file_id, parts=self.total_parts, name=self.file_name)
+        return raw.types.InputFile(
+            id=self.file_id, parts=self.total_parts, name=self.file_name,
+            md5_checksum=self._md5.hexdigest()
+        )
+
+    async def close(self):
+        # sessions belong to the pool => only this upload's workers stop
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+async def _report(up: PartUploader, on_progress):
+    while True:
+        await asyncio.sleep(1)
+        await on_progress(up.uploaded, up.total_size)
+
+
+async def upload_path(client, path: str, on_progress=None, workers: int = UPLOAD_WORKERS, source: str = "url"):
+    """
+    ✅ file on disk => InputFile / InputFileBig (for send_uploaded_*)
+    unlike client.save_file: pooled sessions, parts retried instead of
+    silently dropped, disk reads off the event loop
+    on_progress(uploaded, total) awaited about once per second
+    """
+    total = os.path.getsize(path)
+    up = PartUploader(client, total, os.path.basename(path), workers=workers, source=source)
+    await up.start()
+    reporter = asyncio.create_task(_report(up, on_progress)) if on_progress else None
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, READ_SIZE)
+                if not chunk:
+                    break
+                await up.feed(chunk)
+        return await up.finish()
+    finally:
+        if reporter:
+            reporter.cancel()
+        await up.close()
+
+
+async def send_uploaded_document(client, chat_id, input_file, file_name: str, mime_type: str, caption: str):
+    """
+    messages.SendMedia with an already uploaded file => parsed Message
+    """
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mime_type or "application/octet-stream",
+        file=input_file,
+        force_file=True,
+        attributes=[raw.types.DocumentAttributeFilename(file_name=file_name)]
+    )
+    return await _send_media(client, chat_id, media, caption)
+
+
+async def send_uploaded_video(client, chat_id, input_file, file_name: str, caption: str,
+                              duration: int = 0, width: int = 0, height: int = 0, thumb=None):
+    """
+    same as send_video(supports_streaming=True), but video/thumb were
+    uploaded before (upload_path) => upload can overlap other work
+    """
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mimetypes.guess_type(file_name)[0] or "video/mp4",
+        file=input_file,
+        thumb=thumb,
+        attributes=[
+            raw.types.DocumentAttributeVideo(
+                supports_streaming=True, duration=duration or 0, w=width or 0, h=height or 0
+            ),
+            raw.types.DocumentAttributeFilename(file_name=file_name),
+        ]
+    )
+    return await _send_media(client, chat_id, media, caption)
+
+
+async def _send_media(client, chat_id, media, caption: str):
+    while True:
+        try:
+            r = await client.invoke(
+                raw.functions.messages.SendMedia(
+                    peer=await client.resolve_peer(chat_id),
+                    media=media,
+                    random_id=client.rnd_id(),
+                    **await utils.parse_text_entities(client, caption, None, None)
+                )
+            )
+            break
+        except FloodWait as e:
+            FLOODWAIT_SECONDS.inc(int(e.value), source="send")
+            await asyncio.sleep(int(e.value) + 1)
+        except FilePartMissing as e:
+            # parts are not kept on disk => cannot re-send one
+            raise Exception(f"Telegram lost upload part {e.value}, try again")
+
+    for u in r.updates:
+        if isinstance(u, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, u.message,
+                {i.id: i for i in r.users},
+                {i.id: i for i in r.chats},
+            )
+    return None
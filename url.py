@@ -1,14 +1,34 @@
 import os
 import re
 import time
+import json
+import hashlib
 import asyncio
 import aiohttp
 import humanize
-import subprocess
+import mimetypes
+from contextlib import nullcontext
 from urllib.parse import urlparse, unquote
 
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from net import get_session
+from media import run_tool, run_piped, capabilities, probe, forget_probe, MediaInfo
+from transcode import TRANSCODE_POOL, ENCODE_THREADS
+from store import FileIdCache, JOB_STORE, media_file_id
+from uploader import PartUploader, upload_path, send_uploaded_document, send_uploaded_video
+from singleflight import join_or_start, follow, sub_key
+import progress
+from scheduler import SCHEDULER, DOWNLOAD_GATE, UPLOAD_GATE, queued_text
+from tasks import TASKS
+from disk import DISK, disk_estimate, is_disk_full
+from metrics import (
+    JOBS, JOB_SECONDS, DOWNLOAD_BYTES, DOWNLOAD_SPEED, UPLOAD_SPEED,
+    TRANSCODE_SECONDS, observe_speed,
+)
+from config import URL_SEGMENTS, URL_SEGMENT_MIN_SIZE, URL_RETRIES, VIDEO_MAX_KEYINT, FFPROBE_TIMEOUT
+from config import CACHE_DB, URL_CACHE_TTL, URL_CACHE_MAX, STREAM_UPLOAD, STREAM_TRANSCODE
+
 # -------------------------
 # Config
 # -------------------------
@@ -16,8 +36,13 @@ DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "downloads")
 URL_UPLOAD_LIMIT = 2 * 1024 * 1024 * 1024  # ✅ 2GB
 CHUNK_SIZE = 1024 * 256
 
+DL_TIMEOUT = aiohttp.ClientTimeout(sock_connect=30, sock_read=30, total=None)
+
 URL_STATE = {}              # uid -> url
-PROGRESS_LAST_EDIT = {}     # uid -> last edit time
+
+# ✅ Upload cache: (URL + validators + mode) and (content sha256 + mode) -> file_id
+URL_CACHE = FileIdCache(CACHE_DB, "url_uploads", URL_CACHE_TTL, URL_CACHE_MAX)
+HASH_CACHE = FileIdCache(CACHE_DB, "url_hashes", URL_CACHE_TTL, URL_CACHE_MAX)
 
 
 # -------------------------
@@ -113,256 +138,1023 @@ def make_progress_text(title, done, total, speed, eta):
 
 
 async def safe_edit(msg, text, reply_markup=None):
-    try:
-        await msg.edit(text, reply_markup=reply_markup)
-    except:
-        pass
+    # ✅ through the edit coalescer (drops stale progress of this message)
+    await progress.edit(msg, text, reply_markup)
 
 
 # -------------------------
 # URL meta
 # -------------------------
-async def get_filename_and_size(url: str):
-    filename = None
+CD_FILENAME_STAR = re.compile(r"filename\*\s*=\s*[^']*'[^']*'([^;]+)", re.I)
+CD_FILENAME = re.compile(r"filename\s*=\s*\"?([^\";]+)\"?", re.I)
+
+
+def _filename_from_response(r):
+    """
+    ✅ Content-Disposition (RFC 5987 filename* first) => redirect URL path
+    """
+    cd = r.headers.get("Content-Disposition", "")
+    m = CD_FILENAME_STAR.search(cd)
+    if m:
+        return unquote(m.group(1).strip())
+    m = CD_FILENAME.search(cd)
+    if m:
+        return m.group(1).strip().strip("'")
+
+    p = urlparse(str(r.url))
+    return unquote(os.path.basename(p.path))
+
+
+def response_meta(r):
+    """
+    ✅ Everything we need from ONE response (no separate probe):
+    filename, size, content type, validators
+    206 => size comes from Content-Range
+    """
+    ctype = (r.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+
     total = 0
-    try:
-        timeout = aiohttp.ClientTimeout(total=20)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, allow_redirects=True, headers={"User-Agent": "Mozilla/5.0"}) as r:
-                if r.headers.get("Content-Length"):
-                    total = int(r.headers.get("Content-Length") or 0)
-
-                cd = r.headers.get("Content-Disposition", "")
-                if "filename=" in cd:
-                    filename = cd.split("filename=")[-1].strip().strip('"').strip("'")
-
-                if not filename:
-                    p = urlparse(str(r.url))
-                    base = os.path.basename(p.path)
-                    base = unquote(base)
-                    if base:
-                        filename = base
-    except:
-        pass
+    if r.status == 206:
+        _, total = _range_total(r)
+    elif r.headers.get("Content-Length"):
+        total = int(r.headers.get("Content-Length") or 0)
 
+    filename = _filename_from_response(r)
     if not filename:
-        filename = f"file_{int(time.time())}.bin"
+        ext = mimetypes.guess_extension(ctype) if ctype else None
+        filename = f"file_{int(time.time())}{ext or '.bin'}"
 
-    return safe_filename(filename), total
+    return {
+        "filename": safe_filename(filename),
+        "total": total,
+        "content_type": ctype,
+        "etag": r.headers.get("ETag") or "",
+        "last_modified": r.headers.get("Last-Modified") or "",
+    }
 
 
 # -------------------------
 # FFMPEG
 # -------------------------
-def _ffmpeg_exists():
-    try:
-        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        subprocess.run(["ffprobe", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return True
-    except:
-        return False
+async def _ffmpeg_exists():
+    return (await capabilities()).has_ffmpeg
+
+
+# ✅ What Telegram players stream/seek without trouble
+TG_VIDEO_CODECS = {"h264"}
+TG_PIX_FMTS = {"yuv420p", "yuvj420p"}
+TG_AUDIO_CODECS = {"aac", "mp3"}
 
+VIDEO_FIX_LABELS = {
+    "remux": "⚡ Remux (stream copy, no re-encode)",
+    "audio": "🎧 Audio transcode only (video copied)",
+    "encode": "🔁 Full re-encode (H.264 + AAC)",
+}
 
-def ffprobe_video_info(path: str):
+
+PLAN_ENCODERS = {"remux": (), "audio": ("aac",), "encode": ("libx264", "aac")}
+
+
+def plan_supported(plan: str, caps=None):
     """
-    ✅ OLD FEATURE: needed for Telegram streaming + resume
-    returns: (duration, width, height)
+    ffmpeg on this host has the encoders `plan` needs
+    (encoder list unknown => let ffmpeg try)
     """
-    if not _ffmpeg_exists():
-        return (0, 0, 0)
-
-    try:
-        cmd = [
-            "ffprobe", "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            path
-        ]
-        out = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode(errors="ignore").strip().splitlines()
-        # output order can vary => parse safely
-        dur = 0
-        w = 0
-        h = 0
-        for line in out:
-            line = line.strip()
-            if "." in line and dur == 0:
-                try:
-                    dur = int(float(line))
-                except:
-                    pass
-            else:
-                try:
-                    v = int(line)
-                    if w == 0:
-                        w = v
-                    elif h == 0:
-                        h = v
-                except:
-                    pass
-        return (dur, w, h)
-    except:
-        return (0, 0, 0)
+    if caps is None or not caps.encoders:
+        return True
+    return all(caps.has_encoder(e) for e in PLAN_ENCODERS[plan])
 
 
-def fix_streaming_seek(input_path: str):
+def plan_video_fix(info: MediaInfo, caps=None):
     """
-    🔥 OLD BEST FEATURE:
-    Telegram resume/seek fix (re-encode with keyframes + genpts + faststart)
-    Works more than remux.
+    ✅ Decision stage (cheapest path that still gives Telegram seek/resume):
+    - remux  => H.264 (8-bit 4:2:0) + AAC/MP3/no audio, sane keyframes
+    - audio  => video OK, only audio codec wrong
+    - encode => anything else (last resort)
+    encoder missing on this host (caps) => remux (faststart + genpts only)
     """
-    if not _ffmpeg_exists():
-        return input_path
+    video_ok = (
+        info.vcodec in TG_VIDEO_CODECS
+        and info.pix_fmt in TG_PIX_FMTS
+        and info.max_keyint <= VIDEO_MAX_KEYINT
+    )
+    if not video_ok:
+        plan = "encode"
+    elif not info.acodec or info.acodec in TG_AUDIO_CODECS:
+        plan = "remux"
+    else:
+        plan = "audio"
+    return plan if plan_supported(plan, caps) else "remux"
 
-    out_path = input_path + "_seekfix.mp4"
 
-    # ✅ Very important flags for Telegram seek/resume
+def _video_fix_cmd(input_path: str, out_path: str, plan: str):
     cmd = [
         "ffmpeg", "-y",
         "-fflags", "+genpts",
         "-i", input_path,
         "-avoid_negative_ts", "make_zero",
-        "-map", "0",
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-crf", "23",
-        "-pix_fmt", "yuv420p",
-        "-g", "48",
-        "-keyint_min", "48",
-        "-sc_threshold", "0",
-        "-c:a", "aac",
-        "-b:a", "128k",
-        "-movflags", "+faststart",
-        out_path
     ]
 
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if plan == "remux":
+        cmd += ["-map", "0:v:0", "-map", "0:a:0?", "-c", "copy"]
+    elif plan == "audio":
+        cmd += [
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c:v", "copy",
+            "-c:a", "aac", "-b:a", "128k",
+            "-threads", str(ENCODE_THREADS),
+        ]
+    else:
+        # ✅ Very important flags for Telegram seek/resume
+        cmd += [
+            "-map", "0",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", "23",
+            "-pix_fmt", "yuv420p",
+            "-g", "48",
+            "-keyint_min", "48",
+            "-sc_threshold", "0",
+            "-c:a", "aac",
+            "-b:a", "128k",
+            "-threads", str(ENCODE_THREADS),
+        ]
+
+    cmd += ["-movflags", "+faststart", out_path]
+    return cmd
+
+
+async def _run_video_fix(input_path: str, out_path: str, plan: str, on_queue=None):
+    """
+    ✅ Stream-copy remux is IO only => runs at once
+    Transcodes wait for a TRANSCODE_POOL slot (FIFO, CPU-bounded)
+    """
+    async with (TRANSCODE_POOL.slot(on_queue) if plan != "remux" else nullcontext()):
+        t0 = time.time()
+        try:
+            return await run_tool(_video_fix_cmd(input_path, out_path, plan))
+        finally:
+            TRANSCODE_SECONDS.observe(time.time() - t0, plan=plan, pipeline="staged")
+
+
+async def fix_streaming_seek(input_path: str, plan: str = None, on_queue=None):
+    """
+    🔥 OLD BEST FEATURE:
+    Telegram resume/seek fix (keyframes + genpts + faststart)
+    ✅ Remux-first: stream copy when codecs are already Telegram-ready,
+       audio-only transcode when just audio is wrong, re-encode last.
+    ✅ Transcodes go through TRANSCODE_POOL; on_queue(pos) reports queue position
+    returns: (path, plan_used)
+    """
+    if not await _ffmpeg_exists():
+        return input_path, None
+
+    caps = await capabilities()
+    if not plan:
+        plan = plan_video_fix(await probe(input_path), caps)
+
+    out_path = input_path + "_seekfix.mp4"
 
-    if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+    tries = [plan] if plan == "encode" else [plan, "encode"]
+    tries = [p for p in tries if plan_supported(p, caps)]
+    for p in tries:
+        code = -1
         try:
-            os.remove(input_path)
+            code, _ = await _run_video_fix(input_path, out_path, p, on_queue)
+        except asyncio.CancelledError:
+            raise
         except:
             pass
-        return out_path
 
-    return input_path
+        # ✅ ffmpeg died midway => partial output, never upload it
+        if code != 0:
+            try:
+                if os.path.exists(out_path):
+                    os.remove(out_path)
+            except:
+                pass
+            continue
+
+        if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+            try:
+                os.remove(input_path)
+            except:
+                pass
+            forget_probe(input_path)
+            return out_path, p
+
+    return input_path, None
 
 
-def generate_middle_thumbnail(video_path: str):
-    if not _ffmpeg_exists():
+async def generate_middle_thumbnail(video_path: str, info: MediaInfo = None):
+    if not await _ffmpeg_exists():
         return None
     try:
         thumb = video_path + "_thumb.jpg"
 
-        duration = 0.0
-        try:
-            p = subprocess.check_output([
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                video_path
-            ]).decode().strip()
-            duration = float(p) if p else 0.0
-        except:
-            duration = 0.0
+        info = info or await probe(video_path)
+        duration = info.duration
 
         middle = duration / 2 if duration > 2 else 1
         cmd = ["ffmpeg", "-y", "-ss", str(middle), "-i", video_path, "-vframes", "1", "-q:v", "4", thumb]
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        await run_tool(cmd, timeout=FFPROBE_TIMEOUT)
 
         if os.path.exists(thumb) and os.path.getsize(thumb) > 0:
             return thumb
+    except asyncio.CancelledError:
+        raise
     except:
         pass
     return None
 
 
+# -------------------------
+# RESUME STATE (sidecar manifest)
+# -------------------------
+class _TransientError(Exception):
+    """Network hiccup => retry with Range from saved state"""
+
+
+def url_key(url: str):
+    return hashlib.sha1((url or "").encode("utf-8", errors="ignore")).hexdigest()[:10]
+
+
+def _manifest_path(file_path: str):
+    return file_path + ".part.json"
+
+
+def load_manifest(file_path: str, url: str):
+    """
+    ✅ Returns saved partial state for same URL, or None
+    {"url", "filename", "content_type", "etag", "last_modified", "total",
+     "done": [[start, end], ...]}
+    """
+    try:
+        with open(_manifest_path(file_path), "r", encoding="utf-8") as f:
+            m = json.load(f)
+        if m.get("url") != url or not m.get("total"):
+            return None
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != m["total"]:
+            return None
+        return m
+    except:
+        return None
+
+
+def save_manifest(file_path: str, m: dict):
+    if not m:
+        return
+    tmp = _manifest_path(file_path) + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f)
+        os.replace(tmp, _manifest_path(file_path))
+    except:
+        pass
+
+
+def has_partial(file_path: str):
+    return bool(file_path) and os.path.exists(_manifest_path(file_path)) and os.path.exists(file_path)
+
+
+def drop_partial(file_path: str):
+    for p in (file_path, _manifest_path(file_path)):
+        try:
+            if p and os.path.exists(p):
+                os.remove(p)
+        except:
+            pass
+
+
+def _holes(done, total: int):
+    """
+    ✅ Missing byte ranges (inclusive) = complement of completed ranges
+    """
+    holes = []
+    pos = 0
+    for s, e in sorted(done):
+        if s > pos:
+            holes.append([pos, s - 1])
+        pos = max(pos, e + 1)
+    if pos < total:
+        holes.append([pos, total - 1])
+    return holes
+
+
+def _plan_segments(holes):
+    """
+    ✅ Spread URL_SEGMENTS parallel ranges over the missing holes
+    (bigger hole => more connections, no piece below URL_SEGMENT_MIN_SIZE)
+    segment = [pos, end] (pos advances while downloading)
+    """
+    counts = [1] * len(holes)
+    sizes = [e - s + 1 for s, e in holes]
+    while sum(counts) < URL_SEGMENTS:
+        i = max(range(len(holes)), key=lambda k: sizes[k] / counts[k], default=None)
+        if i is None or sizes[i] // (counts[i] + 1) < URL_SEGMENT_MIN_SIZE:
+            break
+        counts[i] += 1
+
+    segs = []
+    for (s, e), n in zip(holes, counts):
+        step = (e - s + 1) // n
+        for k in range(n):
+            a = s + k * step
+            b = e if k == n - 1 else a + step - 1
+            segs.append([a, b])
+    return segs
+
+
+def _completed(segs, total: int):
+    return _holes([[s, e] for s, e in segs if s <= e], total)
+
+
+def _validator(m: dict):
+    etag = m.get("etag") or ""
+    if etag and not etag.startswith("W/"):
+        return etag
+    return m.get("last_modified") or ""
+
+
+def _range_total(r):
+    """
+    Content-Range: bytes a-b/total => (a, total)
+    """
+    try:
+        cr = r.headers.get("Content-Range", "")
+        rng, total = cr.split(" ", 1)[1].split("/")
+        return int(rng.split("-")[0]), int(total)
+    except:
+        return None, 0
+
+
 # -------------------------
 # PROGRESS
 # -------------------------
-async def upload_progress(current, total, status_msg, uid, start_time, USER_CANCEL: set):
-    if uid in USER_CANCEL:
-        raise asyncio.CancelledError
+async def upload_progress(current, total, status_msg, uid, start_time, handle):
+    handle.check()
 
     elapsed = time.time() - start_time
     speed = current / elapsed if elapsed > 0 else 0
     eta = (total - current) / speed if speed > 0 else 0
 
-    now = time.time()
-    last = PROGRESS_LAST_EDIT.get(uid, 0)
-    if now - last > 3:
-        PROGRESS_LAST_EDIT[uid] = now
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Upload", callback_data=f"cancel_{uid}")]])
-        await safe_edit(status_msg, make_progress_text("📤 Uploading...", current, total, speed, eta), kb)
+    # ✅ numbers only, the coalescer decides when to edit
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Upload", callback_data=f"cancel_{uid}")]])
+    progress.publish(status_msg, make_progress_text, "📤 Uploading...", current, total, speed, eta, reply_markup=kb)
+
 
+def _preallocate(fd: int, total: int):
+    try:
+        os.posix_fallocate(fd, 0, total)
+    except:
+        os.ftruncate(fd, total)
 
-async def download_stream(url, file_path, status_msg, uid, USER_CANCEL: set):
+
+async def _pump(r, fd, seg, uid, handle):
     """
-    ✅ NEW: Fix stuck with stall timeout detector
+    ✅ Write response body into fd at its byte offsets (positional writes)
+    seg = [pos, end] ; end=None => read until EOF (single stream)
     """
-    USER_CANCEL.discard(uid)
+    end = seg[1]
+    last_chunk_time = time.time()
 
-    timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30, total=None)
-    headers = {"User-Agent": "Mozilla/5.0"}
+    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+        handle.check()
 
-    downloaded = 0
-    start_time = time.time()
-    last_edit = 0
-    total = 0
+        if not chunk:
+            if time.time() - last_chunk_time > 60:
+                raise _TransientError("Download stalled (no data). Try again.")
+            continue
 
-    last_chunk_time = time.time()
+        if end is not None:
+            remaining = end + 1 - seg[0]
+            if remaining <= 0:
+                break
+            chunk = chunk[:remaining]
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url, allow_redirects=True, headers=headers) as r:
-            if r.status != 200:
-                raise Exception(f"HTTP {r.status}")
+        last_chunk_time = time.time()
+        os.pwrite(fd, chunk, seg[0])
+        seg[0] += len(chunk)
+        DOWNLOAD_BYTES.inc(len(chunk), source="url")
 
-            ctype = (r.headers.get("Content-Type") or "").lower()
-            if "text/html" in ctype:
-                raise Exception("URL is not a direct file link (HTML page detected)")
+        if end is not None and seg[0] > end:
+            break
+
+    if end is not None and seg[0] <= end:
+        raise _TransientError("Download interrupted (connection closed early). Try again.")
+
+
+async def _fetch_range(session, url, fd, seg, validator, uid, handle):
+    headers = {"Range": f"bytes={seg[0]}-{seg[1]}"}
+    if validator:
+        headers["If-Range"] = validator
+    async with session.get(url, allow_redirects=True, headers=headers, timeout=DL_TIMEOUT) as r:
+        if r.status != 206:
+            if r.status >= 500 or r.status == 429:
+                raise _TransientError(f"HTTP {r.status}")
+            raise Exception(f"HTTP {r.status} (server ignored Range request)")
+        await _pump(r, fd, seg, uid, handle)
+
+
+def _downloaded(st: dict):
+    segs = st.get("segs") or []
+    if st.get("manifest"):
+        return st["total"] - sum(e - s + 1 for s, e in segs if s <= e)
+    return segs[0][0] if segs else 0
+
+
+def _sync_manifest(file_path: str, st: dict):
+    m = st.get("manifest")
+    if m and st.get("segs"):
+        m["done"] = _completed(st["segs"], m["total"])
+        save_manifest(file_path, m)
 
-            if r.headers.get("Content-Length"):
-                total = int(r.headers.get("Content-Length") or 0)
 
+async def _report_download(status_msg, uid, file_path, st: dict):
+    """
+    ✅ One progress publisher for all segments (sums bytes of every range)
+    + saves resume manifest every 3s
+    """
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{uid}")]])
+    tick = 0
+    while True:
+        await asyncio.sleep(1)
+        tick += 1
+        if tick % 3 == 0:
+            _sync_manifest(file_path, st)
+
+        downloaded = _downloaded(st)
+        total = st.get("total", 0)
+        gained = downloaded - st["resumed_from"]
+        elapsed = time.time() - st["start_time"]
+        speed = gained / elapsed if elapsed > 0 else 0
+        eta = (total - downloaded) / speed if total and speed > 0 else 0
+        progress.publish(status_msg, make_progress_text, "⬇️ Downloading...", downloaded, total, speed, eta, reply_markup=kb)
+
+
+async def _download_attempt(session, url, file_path, uid, handle, st: dict):
+    """
+    One connection round:
+    - fresh  => plain GET, live response serves segment 0
+    - resume => Range GET for first hole (+ If-Range), live response serves it
+    Servers without Accept-Ranges => single stream (not resumable)
+    """
+    m = st.get("manifest")
+    headers = {}
+    segs = None
+
+    if m:
+        holes = _holes(m["done"], m["total"])
+        if not holes:
+            # every range on disk already (stopped before the manifest was
+            # removed) => nothing to fetch; size was checked by load_manifest
+            return
+        segs = _plan_segments(holes)
+        headers["Range"] = f"bytes={segs[0][0]}-{segs[0][1]}"
+        validator = _validator(m)
+        if validator:
+            headers["If-Range"] = validator
+
+    async with session.get(url, allow_redirects=True, headers=headers, timeout=DL_TIMEOUT) as r:
+        if m and r.status == 206:
+            start, total = _range_total(r)
+            if start != segs[0][0] or total != m["total"]:
+                st.update({"manifest": None, "segs": None})
+                raise _TransientError("Remote file changed, restarting download")
+        elif r.status != 200:
+            if r.status >= 500 or r.status == 429:
+                raise _TransientError(f"HTTP {r.status}")
+            raise Exception(f"HTTP {r.status}")
+        else:
+            m = None  # 200 => full body (fresh start or file changed)
+
+        total = m["total"] if m else 0
+        if not m:
+            meta = response_meta(r)
+            if meta["content_type"] == "text/html":
+                raise Exception("URL is not a direct file link (HTML page detected)")
+
+            total = meta["total"]
             if total and total > URL_UPLOAD_LIMIT:
                 raise Exception("❌ URL file too large (max 2GB)")
 
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            st["meta"] = meta
+
+            # ✅ upload cache check: headers are enough, body never read on hit
+            hit = st["lookup"](meta) if st.get("lookup") else None
+            if hit:
+                st["cached"] = hit
+                return
+            if st.get("reserve"):
+                await st["reserve"](meta)
+
+            accept_ranges = (r.headers.get("Accept-Ranges") or "").lower() == "bytes"
+            encoded = (r.headers.get("Content-Encoding") or "identity").lower() != "identity"
+            if accept_ranges and total and not encoded:
+                m = dict(meta, url=url, done=[])
+                segs = _plan_segments([[0, total - 1]])
+            else:
+                segs = [[0, None]]
 
-            kb0 = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{uid}")]])
-            await safe_edit(status_msg, make_progress_text("⬇️ Downloading...", 0, total, 0, 0), kb0)
+        final_url = str(r.url)
+        validator = _validator(m) if m else ""
+        fresh = r.status == 200
+        st.update({"manifest": m, "segs": segs, "total": total})
 
-            with open(file_path, "wb") as f:
-                async for chunk in r.content.iter_chunked(CHUNK_SIZE):
-                    if uid in USER_CANCEL:
-                        raise asyncio.CancelledError
+        flags = os.O_WRONLY | os.O_CREAT
+        if fresh:
+            flags |= os.O_TRUNC
+            st["resumed_from"] = 0
+            st["start_time"] = time.time()
 
-                    if not chunk:
-                        if time.time() - last_chunk_time > 60:
-                            raise Exception("Download stalled (no data). Try again.")
-                        continue
+        workers = []
+        fd = os.open(file_path, flags, 0o644)
+        try:
+            if m and fresh:
+                _preallocate(fd, total)
+                save_manifest(file_path, m)
+
+            # first segment => live response, rest => Range requests
+            workers.append(asyncio.create_task(_pump(r, fd, segs[0], uid, handle)))
+            for seg in segs[1:]:
+                workers.append(asyncio.create_task(_fetch_range(session, final_url, fd, seg, validator, uid, handle)))
+
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                if not w.done():
+                    w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            os.close(fd)
+
+
+async def download_stream(url, file_path, status_msg, uid, handle, lookup=None, reserve=None):
+    """
+    ✅ NEW: Fix stuck with stall timeout detector
+    ✅ Multi-connection: if server sends Accept-Ranges, file is split into
+       URL_SEGMENTS byte ranges fetched together into a preallocated file.
+       Falls back to single stream when ranges are not supported.
+    ✅ Resumable: completed ranges are kept in `<file>.part.json`; network
+       errors retry with Range + backoff, and a later job for the same URL
+       continues from the saved state.
+    ✅ Single request for meta + body: returns
+       {"filename", "total", "content_type", "etag", "last_modified", "cached"}
+    ✅ lookup(meta) -> cache hit or None, called once headers are known;
+       a hit stops before the body ("cached" = hit)
+    ✅ await reserve(meta) on a miss, before anything is written
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    m = load_manifest(file_path, url)
+    st = {"manifest": m, "segs": None, "total": m["total"] if m else 0, "start_time": time.time(), "meta": m}
+    st["lookup"] = lookup
+    st["reserve"] = reserve
+    st["cached"] = lookup(m) if (lookup and m) else None
+    if st["cached"]:
+        return dict(_meta_fields(m), cached=st["cached"])
+    if m and reserve:
+        await reserve(m)
+    st["resumed_from"] = (m["total"] - sum(e - s + 1 for s, e in _holes(m["done"], m["total"]))) if m else 0
+
+    kb0 = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{uid}")]])
+    title = "♻️ Resuming Download..." if m else "⬇️ Downloading..."
+    await safe_edit(status_msg, make_progress_text(title, st["resumed_from"], st["total"], 0, 0), kb0)
+
+    reporter = asyncio.create_task(_report_download(status_msg, uid, file_path, st))
+    try:
+        session = await get_session()
+        attempt = 0
+        while True:
+            try:
+                await _download_attempt(session, url, file_path, uid, handle, st)
+                break
+            except (_TransientError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                _sync_manifest(file_path, st)
+                attempt += 1
+                if attempt > URL_RETRIES:
+                    raise Exception(f"{e or type(e).__name__} (after {URL_RETRIES} retries)")
+
+                wait = min(30, 2 ** attempt)
+                await safe_edit(
+                    status_msg,
+                    f"⚠️ Connection problem: `{e or type(e).__name__}`\n\n"
+                    f"🔁 Retrying in {wait}s ({attempt}/{URL_RETRIES})...",
+                    kb0
+                )
+                await asyncio.sleep(wait)
+                handle.check()
+    except asyncio.CancelledError:
+        raise
+    except:
+        _sync_manifest(file_path, st)
+        raise
+    finally:
+        reporter.cancel()
+
+    # ✅ complete => manifest not needed anymore
+    if not st.get("cached"):
+        try:
+            os.remove(_manifest_path(file_path))
+        except:
+            pass
+        observe_speed(DOWNLOAD_SPEED, "url", _downloaded(st) - st["resumed_from"], time.time() - st["start_time"])
+
+    return dict(_meta_fields(st["meta"]), cached=st.get("cached"))
+
+
+def _meta_fields(meta: dict):
+    return {k: meta.get(k) for k in ("filename", "total", "content_type", "etag", "last_modified")}
+
+
+# -------------------------
+# STREAMING UPLOAD (file mode)
+# -------------------------
+def make_stream_text(downloaded, uploaded, total, speed, eta):
+    return (
+        f"✨ **⬇️📤 Downloading + Uploading...**\n\n"
+        f"{make_circle_bar(uploaded / total * 100 if total else 0)}\n\n"
+        f"⬇️ Downloaded: **{naturalsize(downloaded)} / {naturalsize(total)}**\n"
+        f"📤 Uploaded: **{naturalsize(uploaded)} / {naturalsize(total)}**\n"
+        f"⚡ Speed: **{naturalsize(int(speed)) + '/s' if speed else '0 B/s'}**\n"
+        f"⏳ ETA: **{format_time(eta)}**"
+    )
+
+
+def stream_eligible(r, meta: dict):
+    """
+    known size, plain body (no gzip), not HTML, within limit
+    """
+    encoded = (r.headers.get("Content-Encoding") or "identity").lower() != "identity"
+    total = meta["total"]
+    return (
+        r.status == 200 and total > 0 and total <= URL_UPLOAD_LIMIT
+        and not encoded and meta["content_type"] != "text/html"
+    )
+
+
+async def _stream_body(r, sink, st: dict, uid, handle):
+    total = st["total"]
+    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+        handle.check()
+        if total:
+            chunk = chunk[:total - st["pos"]]
+            if not chunk:
+                break
+        st["pos"] += len(chunk)
+        DOWNLOAD_BYTES.inc(len(chunk), source="url")
+        await sink(chunk)
+
+    if total and st["pos"] < total:
+        raise _TransientError("Download interrupted (connection closed early). Try again.")
 
-                    last_chunk_time = time.time()
-                    f.write(chunk)
-                    downloaded += len(chunk)
 
-                    elapsed = time.time() - start_time
-                    speed = downloaded / elapsed if elapsed > 0 else 0
-                    eta = (total - downloaded) / speed if total and speed > 0 else 0
+async def _stream_resumable(session, r, sink, st: dict, status_msg, uid, handle):
+    """
+    r's body (from st["pos"]) => sink(chunk), in order
+    network errors => Range GET from st["pos"] (+ If-Range), same
+    retries/backoff as download_stream; needs Accept-Ranges + known size
+    """
+    accept_ranges = (r.headers.get("Accept-Ranges") or "").lower() == "bytes" and st["total"] > 0
+    final_url = str(r.url)
+    validator = _validator(st["meta"])
 
-                    if time.time() - last_edit > 3:
-                        last_edit = time.time()
-                        kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Download", callback_data=f"cancel_{uid}")]])
-                        await safe_edit(status_msg, make_progress_text("⬇️ Downloading...", downloaded, total, speed, eta), kb)
+    attempt = 0
+    while True:
+        try:
+            if attempt == 0:
+                await _stream_body(r, sink, st, uid, handle)
+            else:
+                headers = {"Range": f"bytes={st['pos']}-"}
+                if validator:
+                    headers["If-Range"] = validator
+                async with session.get(final_url, headers=headers, timeout=DL_TIMEOUT) as rr:
+                    if rr.status != 206 or _range_total(rr) != (st["pos"], st["total"]):
+                        raise Exception("Remote file changed during download, try again")
+                    await _stream_body(rr, sink, st, uid, handle)
+            return
+        except (_TransientError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            attempt += 1
+            if not accept_ranges or attempt > URL_RETRIES:
+                raise Exception(f"{e or type(e).__name__} (after {attempt - 1} retries)")
+            wait = min(30, 2 ** attempt)
+            await safe_edit(
+                status_msg,
+                f"⚠️ Connection problem: `{e or type(e).__name__}`\n\n"
+                f"🔁 Retrying in {wait}s ({attempt}/{URL_RETRIES})..."
+            )
+            await asyncio.sleep(wait)
+
+
+async def _report_stream(status_msg, uid, up, st: dict):
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+    while True:
+        await asyncio.sleep(1)
+        elapsed = time.time() - st["start_time"]
+        speed = up.uploaded / elapsed if elapsed > 0 else 0
+        eta = (st["total"] - up.uploaded) / speed if speed > 0 else 0
+        progress.publish(
+            status_msg, make_stream_text,
+            st["pos"], up.uploaded, st["total"], speed, eta,
+            reply_markup=kb
+        )
+
+
+async def stream_upload(client, flight, url, status_msg, uid, handle, lookup=None):
+    """
+    ✅ File mode without local staging: response body => Telegram parts
+    while it downloads (bounded buffer, see uploader.py)
+    - None => not streamable (unknown size / gzip / HTML), use download_stream
+    - network errors => Range resume from the current byte (parts already
+      uploaded stay valid)
+    returns {"meta", "cached", "sent", "caption", "sha256"}
+    """
+    session = await get_session()
+
+    async with session.get(url, allow_redirects=True, timeout=DL_TIMEOUT) as r:
+        if r.status != 200:
+            return None
+        meta = response_meta(r)
+        hit = lookup(meta) if lookup else None
+        if hit:
+            return {"meta": meta, "cached": hit}
+        if not stream_eligible(r, meta):
+            return None
+
+        st = {"pos": 0, "total": meta["total"], "meta": meta, "start_time": time.time()}
+        h = hashlib.sha256()
+        up = PartUploader(client, meta["total"], meta["filename"])
+
+        async def sink(chunk):
+            h.update(chunk)
+            await up.feed(chunk)
+
+        await up.start()
+        reporter = asyncio.create_task(_report_stream(status_msg, uid, up, st))
+        try:
+            await _stream_resumable(session, r, sink, st, status_msg, uid, handle)
+            input_file = await up.finish()
+        finally:
+            reporter.cancel()
+            await up.close()
+
+    elapsed = time.time() - st["start_time"]
+    observe_speed(DOWNLOAD_SPEED, "url", meta["total"], elapsed)
+    observe_speed(UPLOAD_SPEED, "url", meta["total"], elapsed)
+
+    name_clean = clean_display_name(meta["filename"])
+    caption = f"✅ Uploaded 📁\n\n📌 `{name_clean}`\n📦 {naturalsize(meta['total'])}"
+    target_uid, chat_id = flight.upload_target()
+    sent = await send_uploaded_document(
+        client, chat_id, input_file, meta["filename"], meta["content_type"], caption
+    )
+    flight.delivered.add(target_uid)
+    return {"meta": meta, "cached": None, "sent": sent, "caption": caption, "sha256": h.hexdigest()}
+
+
+# -------------------------
+# STREAMING TRANSCODE (video mode)
+# -------------------------
+STREAM_HEAD = 4 * 1024 * 1024   # bytes probed before ffmpeg starts
+
+
+def pipe_friendly(head: bytes):
+    """
+    MP4/MOV decodes from a pipe only with its index (moov) before the
+    media data (mdat); MKV/WebM, MPEG-TS and FLV always stream
+    """
+    if head[4:8] == b"ftyp":
+        pos = 0
+        while pos + 8 <= len(head):
+            size = int.from_bytes(head[pos:pos + 4], "big")
+            kind = head[pos + 4:pos + 8]
+            if kind == b"moov":
+                return True
+            if kind == b"mdat":
+                return False
+            if size == 1:
+                size = int.from_bytes(head[pos + 8:pos + 16], "big")
+            if size < 8:
+                return False
+            pos += size
+        return False
+    return head[:4] == b"\x1a\x45\xdf\xa3" or head[:1] == b"\x47" or head[:3] == b"FLV"
+
+
+def make_pipe_text(label, downloaded, total, speed, encoded, enc_speed, duration):
+    enc_total = f" / {format_time(duration)}" if duration else ""
+    return (
+        f"✨ **⬇️🎥 Downloading + Converting...**\n\n"
+        f"{label}\n\n"
+        f"{make_circle_bar(downloaded / total * 100 if total else 0)}\n\n"
+        f"⬇️ Downloaded: **{naturalsize(downloaded)} / {naturalsize(total) if total else '??'}**\n"
+        f"⚡ Speed: **{naturalsize(int(speed)) + '/s' if speed else '0 B/s'}**\n"
+        f"🎥 Converted: **{format_time(encoded)}{enc_total}** ({enc_speed or '--'})"
+    )
+
+
+async def _report_pipe(status_msg, uid, label, duration, st: dict):
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+    while True:
+        await asyncio.sleep(1)
+        elapsed = time.time() - st["start_time"]
+        speed = st["pos"] / elapsed if elapsed > 0 else 0
+        progress.publish(
+            status_msg, make_pipe_text,
+            label, st["pos"], st["total"], speed, st["encoded"], st["enc_speed"], duration,
+            reply_markup=kb
+        )
+
+
+async def _read_head(r, limit: int):
+    head = bytearray()
+    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+        head += chunk
+        if len(head) >= limit:
+            break
+    return bytes(head)
+
+
+async def stream_transcode(url, file_path, status_msg, uid, handle, lookup=None, reserve=None):
+    """
+    ✅ Video mode: response body => ffmpeg stdin while it downloads
+    - first STREAM_HEAD bytes probed => same remux/audio/encode plan as
+      fix_streaming_seek (encode needs a free TRANSCODE_POOL slot right now)
+    - output is a regular file => "+faststart" second pass puts moov first
+    - None => not streamable (MP4 with index at the end, gzip, HTML, busy
+      encoder, ffmpeg failed on the pipe), use the staged path
+    returns {"meta", "cached", "path", "plan", "sha256"}
+    """
+    session = await get_session()
+
+    async with session.get(url, allow_redirects=True, timeout=DL_TIMEOUT) as r:
+        if r.status != 200:
+            return None
+        meta = response_meta(r)
+        hit = lookup(meta) if lookup else None
+        if hit:
+            return {"meta": meta, "cached": hit}
+
+        encoded = (r.headers.get("Content-Encoding") or "identity").lower() != "identity"
+        if encoded or meta["content_type"] == "text/html" or meta["total"] > URL_UPLOAD_LIMIT:
+            return None
+
+        head = await _read_head(r, STREAM_HEAD)
+        DOWNLOAD_BYTES.inc(len(head), source="url")
+        if not pipe_friendly(head):
+            return None
+
+        head_path = file_path + ".head"
+        with open(head_path, "wb") as f:
+            f.write(head)
+        try:
+            info = await probe(head_path)
+        finally:
+            forget_probe(head_path)
+            try:
+                os.remove(head_path)
+            except:
+                pass
+        if not info.ok:
+            return None
+
+        plan = plan_video_fix(info, await capabilities())
+        # head too short to see keyframe spacing => staged path probes the file
+        if plan != "encode" and not info.keyint_known:
+            return None
+        if plan != "remux" and not TRANSCODE_POOL.free():
+            return None
+        if reserve:
+            await reserve(meta)
+
+        out_path = os.path.join(
+            os.path.dirname(file_path),
+            f"{os.path.basename(file_path)[:-len('.part')]}_{clean_display_name(meta['filename'])}.mp4"
+        )
+        st = {
+            "pos": len(head), "total": meta["total"], "meta": meta, "start_time": time.time(),
+            "encoded": 0, "enc_speed": "",
+        }
+        h = hashlib.sha256(head)
+
+        def on_progress(block):
+            try:
+                st["encoded"] = int(block.get("out_time_us") or 0) / 1_000_000
+            except ValueError:
+                pass
+            st["enc_speed"] = block.get("speed", "").strip()
+
+        async def feed(stdin):
+            async def sink(chunk):
+                h.update(chunk)
+                stdin.write(chunk)
+                await stdin.drain()
+
+            stdin.write(head)
+            await stdin.drain()
+            await _stream_resumable(session, r, sink, st, status_msg, uid, handle)
+
+        cmd = _video_fix_cmd("pipe:0", out_path, plan)
+        cmd = cmd[:-1] + ["-progress", "pipe:1", "-nostats", out_path]
+
+        reporter = asyncio.create_task(_report_pipe(status_msg, uid, VIDEO_FIX_LABELS[plan], info.duration, st))
+        ok = False
+        try:
+            async with (TRANSCODE_POOL.slot() if plan != "remux" else nullcontext()):
+                code = await run_piped(cmd, feed, on_progress)
+            elapsed = time.time() - st["start_time"]
+            TRANSCODE_SECONDS.observe(elapsed, plan=plan, pipeline="stream")
+            observe_speed(DOWNLOAD_SPEED, "url", st["pos"], elapsed)
+            ok = code == 0 and os.path.exists(out_path) and os.path.getsize(out_path) > 0
+        finally:
+            reporter.cancel()
+            if not ok:
+                try:
+                    os.remove(out_path)
+                except:
+                    pass
+
+    if not ok:
+        return None
+    return {"meta": meta, "cached": None, "path": out_path, "plan": plan, "sha256": h.hexdigest()}
+
+
+# -------------------------
+# UPLOAD CACHE
+# -------------------------
+def url_cache_key(url: str, meta: dict, mode: str):
+    """
+    URL + ETag/Last-Modified + size + mode
+    no validator => "" (remote file may change silently, don't cache)
+    """
+    if not meta or not (meta.get("etag") or meta.get("last_modified")):
+        return ""
+    raw = "|".join([url, meta.get("etag") or "", meta.get("last_modified") or "", str(meta.get("total") or 0), mode])
+    return hashlib.sha256(raw.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def _sha256_file(path: str):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(4 * 1024 * 1024)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+async def content_key(path: str, mode: str):
+    # hashing 2GB takes seconds => thread, loop stays free
+    return f"{await asyncio.to_thread(_sha256_file, path)}:{mode}"
+
+
+async def send_cached_upload(client, flight, hit: dict, mode: str):
+    """
+    ✅ Resend stored file_id (no download / transcode / upload)
+    to every user attached to the flight
+    """
+    meta = hit.get("meta") or {}
+    icon = "🎥" if mode == "video" else "📁"
+    caption = f"✅ Uploaded {icon}\n\n📌 `{meta.get('name', '')}`\n📦 {naturalsize(meta.get('size'))}"
+    try:
+        target_uid, chat_id = flight.upload_target()
+        await client.send_cached_media(chat_id=chat_id, file_id=hit["file_id"], caption=caption)
+    except asyncio.CancelledError:
+        raise
+    except:
+        return False
+
+    flight.delivered.add(target_uid)
+    await flight.deliver(client, hit["file_id"], caption)
+    return True
 
 
 # -------------------------
 # PUBLIC API
 # -------------------------
+def remember_url(uid: int, url: str):
+    """
+    URL waiting for the File/Video choice (kept across restarts)
+    """
+    URL_STATE[uid] = url
+    JOB_STORE.put_url(uid, url)
+
+
+def forget_url(uid: int, url: str):
+    # ✅ user may already have sent the next URL (queued jobs)
+    if URL_STATE.get(uid) == url:
+        URL_STATE.pop(uid, None)
+        JOB_STORE.drop_url(uid)
+
+
+def restore_url_state():
+    URL_STATE.update(JOB_STORE.urls())
+    return len(URL_STATE)
+
+
 async def url_flow(client, message, url: str):
     uid = message.from_user.id
-    URL_STATE[uid] = url
+    remember_url(uid, url)
 
     kb = InlineKeyboardMarkup([
         [
@@ -381,8 +1173,6 @@ async def url_flow(client, message, url: str):
 async def url_callback_router(
     client,
     cb,
-    USER_TASKS,
-    USER_CANCEL,
     get_or_create_status,
     main_menu_keyboard,
     DOWNLOAD_DIR
@@ -402,76 +1192,259 @@ async def url_callback_router(
     await safe_edit(status, "⏳ Processing started...\n\n⬇️ Preparing download...")
     await asyncio.sleep(0.2)
 
-    async def job():
+    await start_url_job(client, uid, cb.message.chat.id, status, url, mode, main_menu_keyboard, DOWNLOAD_DIR)
+
+
+async def start_url_job(client, uid: int, chat_id: int, status, url: str, mode: str,
+                        main_menu_keyboard, DOWNLOAD_DIR, created: float = None):
+    """
+    queue (or attach to) the URL job behind `status`; also used by bot.py
+    to start unfinished jobs again after a restart
+    """
+    async def job(flight):
+        # ✅ status edits fan out to every user attached to this URL
+        status = flight.status
         file_path = None
         thumb_path = None
+        keep_partial = False
+        disk_ticket = None
+        outcome = "failed"
+        started = time.time()
+        cancel_kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+
+        def waiting_for(stage):
+            async def on_queue(pos):
+                handle.set_stage(f"wait_{stage.replace(' ', '_')}")
+                await safe_edit(status, f"🕒 Waiting for {stage} slot...\n\nQueue position: **#{pos}**", cancel_kb)
+            return on_queue
 
         try:
-            USER_CANCEL.discard(uid)
-
-            fname, _ = await get_filename_and_size(url)
-            name_clean = clean_display_name(fname)
-            file_path = os.path.join(DOWNLOAD_DIR, f"url_{uid}_{int(time.time())}_{fname}")
-
-            # ✅ Download
-            await download_stream(url, file_path, status, uid, USER_CANCEL)
-
-            if uid in USER_CANCEL:
-                raise asyncio.CancelledError
+            handle.set_stage("start")
+            # ✅ same user + same URL + mode => same path (resume partial download);
+            # a file and a video job of one URL never share (or truncate) a file
+            file_path = os.path.join(DOWNLOAD_DIR, f"url_{uid}_{mode}_{url_key(url)}.part")
+
+            lookup = lambda m: URL_CACHE.get(url_cache_key(url, m, mode))
+
+            async def reserve_disk(meta):
+                # ✅ worst case on disk (download + seekfix copy) before writing;
+                # called by the download once headers are known and the cache
+                # missed => cached URLs never queue for disk, no extra HEAD
+                nonlocal disk_ticket
+                if disk_ticket is None:
+                    stage = handle.stage
+                    disk_ticket = await DISK.acquire(disk_estimate(meta.get("total") or 0, mode), waiting_for("disk space"))
+                    handle.set_stage(stage)
+
+            async def cached_done(hit):
+                nonlocal outcome
+                if await send_cached_upload(client, flight, hit, mode):
+                    outcome = "cached"
+                    await safe_edit(status, "✅ Done ✅ (⚡ cached, no re-upload)", reply_markup=main_menu_keyboard())
+                    return True
+                return False
+
+            # ✅ File mode: download + upload at once, nothing staged on disk
+            # (a saved partial download is resumed by the staged path instead)
+            if mode == "file" and STREAM_UPLOAD and not has_partial(file_path):
+                async with DOWNLOAD_GATE.slot(waiting_for("download")):
+                    async with UPLOAD_GATE.slot(waiting_for("upload")):
+                        handle.set_stage("stream_upload")
+                        try:
+                            res = await stream_upload(client, flight, url, status, uid, handle, lookup)
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception as e:
+                            if is_disk_full(e):
+                                raise
+                            # ✅ streamed bytes leave nothing to resume => staged path
+                            # below (a failure there keeps the partial for a resend)
+                            await safe_edit(
+                                status,
+                                f"⚠️ Streaming upload failed: `{e}`\n\n♻️ Retrying via disk (resumable)...",
+                                cancel_kb
+                            )
+                            res = None
+
+                if res and res["cached"]:
+                    if await cached_done(res["cached"]):
+                        return
+                    URL_CACHE.delete(url_cache_key(url, res["meta"], mode))
+                    lookup = None
+                elif res:
+                    file_id = media_file_id(res["sent"])
+                    cache_meta = {"name": clean_display_name(res["meta"]["filename"]), "size": res["meta"]["total"]}
+                    URL_CACHE.put(url_cache_key(url, res["meta"], mode), file_id, cache_meta)
+                    HASH_CACHE.put(f"{res['sha256']}:{mode}", file_id, cache_meta)
+                    await flight.deliver(client, file_id, res["caption"])
+                    outcome = "done"
+                    await safe_edit(status, "✅ Done ✅", reply_markup=main_menu_keyboard())
+                    return
+
+            # ✅ Video mode: response body piped into ffmpeg (encode overlaps download)
+            streamed = None
+            if mode == "video" and STREAM_TRANSCODE and not has_partial(file_path) and await _ffmpeg_exists():
+                async with DOWNLOAD_GATE.slot(waiting_for("download")):
+                    handle.set_stage("stream_transcode")
+                    streamed = await stream_transcode(url, file_path, status, uid, handle, lookup, reserve_disk)
+
+                if streamed and streamed["cached"]:
+                    if await cached_done(streamed["cached"]):
+                        return
+                    URL_CACHE.delete(url_cache_key(url, streamed["meta"], mode))
+                    lookup = None
+                    streamed = None
+                if not streamed:
+                    # nothing left on disk => never hold a reservation while
+                    # waiting for the download slot again
+                    DISK.release(disk_ticket)
+                    disk_ticket = None
+
+            if streamed:
+                meta = streamed["meta"]
+                ukey = url_cache_key(url, meta, mode)
+                file_path = streamed["path"]
+                name_clean = clean_display_name(meta["filename"])
+                # source bytes hash => same key as the staged path
+                hkey = f"{streamed['sha256']}:{mode}"
+            else:
+                # ✅ Download (filename/size/type come from the same response)
+                # cache hit on URL + validators => body never downloaded
+                async with DOWNLOAD_GATE.slot(waiting_for("download")):
+                    handle.set_stage("download")
+                    meta = await download_stream(url, file_path, status, uid, handle, lookup=lookup, reserve=reserve_disk)
+                ukey = url_cache_key(url, meta, mode)
+
+                if meta.get("cached"):
+                    if await cached_done(meta["cached"]):
+                        return
+                    URL_CACHE.delete(ukey)
+                    async with DOWNLOAD_GATE.slot(waiting_for("download")):
+                        handle.set_stage("download")
+                        meta = await download_stream(url, file_path, status, uid, handle, reserve=reserve_disk)
+
+                handle.check()
+
+                fname = meta["filename"]
+                name_clean = clean_display_name(fname)
+                final_path = os.path.join(DOWNLOAD_DIR, f"url_{uid}_{mode}_{url_key(url)}_{fname}")
+                os.replace(file_path, final_path)
+                file_path = final_path
+                hkey = await content_key(file_path, mode)
 
             size = os.path.getsize(file_path)
 
+            # ✅ same bytes already uploaded (other URL / changed validators)
+            hit = HASH_CACHE.get(hkey)
+            if hit:
+                if await cached_done(hit):
+                    URL_CACHE.put(ukey, hit["file_id"], hit.get("meta"))
+                    return
+                HASH_CACHE.delete(hkey)
+
             # ✅ Video pipeline (OLD seek fix restore)
             dur = w = h = 0
-            if mode == "video":
-                await safe_edit(status, "🎥 Fixing Streaming + Seek/Resume...\n\n⏳ Please wait...")
-
-                # 🔥 Restore old working logic
-                file_path = fix_streaming_seek(file_path)
+            if mode == "video" and streamed:
+                # already converted while downloading
+                info = await probe(file_path)
+                fix_line = f"✅ {VIDEO_FIX_LABELS[streamed['plan']]}\n\n"
+                dur, w, h = int(info.duration), info.width, info.height
+
+                await safe_edit(status, f"{fix_line}🖼 Generating Thumbnail (Middle Frame)...\n\n⏳ Please wait...")
+                handle.set_stage("thumbnail")
+                thumb_path = await generate_middle_thumbnail(file_path, info)
+
+            elif mode == "video":
+                # ✅ one probe for decision + thumbnail + upload meta
+                info = await probe(file_path)
+                plan = plan_video_fix(info, await capabilities())
+                await safe_edit(
+                    status,
+                    f"🎥 Fixing Streaming + Seek/Resume...\n\n{VIDEO_FIX_LABELS[plan]}\n\n⏳ Please wait..."
+                )
 
-                dur, w, h = ffprobe_video_info(file_path)
+                async def on_queue(pos):
+                    await safe_edit(
+                        status,
+                        f"🎥 Waiting for encoder slot...\n\n{VIDEO_FIX_LABELS[plan]}\n\n"
+                        f"🕒 Queue position: **#{pos}**",
+                        cancel_kb
+                    )
+
+                # 🔥 Remux-first (re-encode only when needed)
+                handle.set_stage("transcode")
+                file_path, used = await fix_streaming_seek(file_path, plan, on_queue)
+                fix_line = f"✅ {VIDEO_FIX_LABELS[used]}\n\n" if used else ""
+
+                # remux/transcode keep duration + dimensions => reuse input probe
+                if not info.ok:
+                    info = await probe(file_path)
+                dur, w, h = int(info.duration), info.width, info.height
                 name_clean = clean_display_name(os.path.basename(file_path))
 
-                await safe_edit(status, "🖼 Generating Thumbnail (Middle Frame)...\n\n⏳ Please wait...")
-                thumb_path = generate_middle_thumbnail(file_path)
-
-            # ✅ Upload
-            up_start = time.time()
-            if mode == "video":
-                await safe_edit(status, "📤 Upload Starting (Video MP4)...")
-                await client.send_video(
-                    chat_id=cb.message.chat.id,
-                    video=file_path,
-                    thumb=thumb_path if thumb_path else None,
-                    caption=f"✅ Uploaded 🎥\n\n📌 `{name_clean}`\n📦 {naturalsize(size)}",
-                    supports_streaming=True,
-                    duration=dur if dur else None,
-                    width=w if w else None,
-                    height=h if h else None,
-                    progress=upload_progress,
-                    progress_args=(status, uid, up_start, USER_CANCEL),
-                )
-            else:
-                await safe_edit(status, "📤 Upload Starting (File)...")
-                await client.send_document(
-                    chat_id=cb.message.chat.id,
-                    document=file_path,
-                    caption=f"✅ Uploaded 📁\n\n📌 `{name_clean}`\n📦 {naturalsize(size)}",
-                    progress=upload_progress,
-                    progress_args=(status, uid, up_start, USER_CANCEL),
-                )
+                await safe_edit(status, f"{fix_line}🖼 Generating Thumbnail (Middle Frame)...\n\n⏳ Please wait...")
+                handle.set_stage("thumbnail")
+                thumb_path = await generate_middle_thumbnail(file_path, info)
+
+            # ✅ Upload (first attached user gets the upload, others a file_id resend)
+            async with UPLOAD_GATE.slot(waiting_for("upload")):
+                handle.set_stage("upload")
+                up_start = time.time()
+                target_uid, chat_id = flight.upload_target()
+                file_name = os.path.basename(file_path)
+
+                async def on_progress(current, total):
+                    await upload_progress(current, total, status, uid, up_start, handle)
+
+                # ✅ parallel parts over the shared session pool (uploader.py)
+                if mode == "video":
+                    caption = f"✅ Uploaded 🎥\n\n📌 `{name_clean}`\n📦 {naturalsize(size)}"
+                    await safe_edit(status, "📤 Upload Starting (Video MP4)...")
+                    thumb = await upload_path(client, thumb_path) if thumb_path else None
+                    input_file = await upload_path(client, file_path, on_progress)
+                    sent = await send_uploaded_video(
+                        client, chat_id, input_file, file_name, caption,
+                        duration=dur, width=w, height=h, thumb=thumb
+                    )
+                else:
+                    caption = f"✅ Uploaded 📁\n\n📌 `{name_clean}`\n📦 {naturalsize(size)}"
+                    await safe_edit(status, "📤 Upload Starting (File)...")
+                    input_file = await upload_path(client, file_path, on_progress)
+                    sent = await send_uploaded_document(
+                        client, chat_id, input_file, file_name, mimetypes.guess_type(file_name)[0], caption
+                    )
+                observe_speed(UPLOAD_SPEED, "url", size, time.time() - up_start)
+
+            file_id = media_file_id(sent)
+            flight.delivered.add(target_uid)
+            cache_meta = {"name": name_clean, "size": size}
+            URL_CACHE.put(ukey, file_id, cache_meta)
+            HASH_CACHE.put(hkey, file_id, cache_meta)
+            handle.set_stage("deliver")
+            await flight.deliver(client, file_id, caption)
+            outcome = "done"
 
             await safe_edit(status, "✅ Done ✅", reply_markup=main_menu_keyboard())
 
         except asyncio.CancelledError:
-            await safe_edit(status, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
+            if TASKS.closing:
+                # ✅ restart, not the cancel button => job comes back, partial stays
+                outcome = "restarted"
+                keep_partial = has_partial(file_path)
+                await safe_edit(status, "♻️ Bot restarting...\n\n⏳ This job continues automatically after the restart.")
+            else:
+                outcome = "cancelled"
+                await safe_edit(status, "❌ Cancelled ✅", reply_markup=main_menu_keyboard())
 
         except Exception as e:
-            await safe_edit(status, f"❌ URL Upload Failed!\n\nError: `{e}`", reply_markup=main_menu_keyboard())
+            if is_disk_full(e):
+                e = "Server disk is full, try again later"
+            keep_partial = has_partial(file_path)
+            hint = "\n\n♻️ Partial download saved. Send the same URL again to resume." if keep_partial else ""
+            await safe_edit(status, f"❌ URL Upload Failed!\n\nError: `{e}`{hint}", reply_markup=main_menu_keyboard())
 
         finally:
-            URL_STATE.pop(uid, None)
-            USER_CANCEL.discard(uid)
+            forget_url(uid, url)
 
             try:
                 if thumb_path and os.path.exists(thumb_path):
@@ -479,10 +1452,40 @@ async def url_callback_router(
             except:
                 pass
 
-            try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
+            if file_path and not keep_partial:
+                drop_partial(file_path)
+                forget_probe(file_path)
+
+            DISK.release(disk_ticket)
+            JOBS.inc(type=f"url_{mode}", outcome=outcome)
+            JOB_SECONDS.observe(time.time() - started, type=f"url_{mode}")
+
+    def scheduled(flight):
+        # ✅ waits for its turn (per-user FIFO, round-robin across users)
+        async def on_queue(pos):
+            kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{uid}")]])
+            await safe_edit(flight.status, queued_text(pos), kb)
+
+        async def on_reject(reason):
+            JOBS.inc(type=f"url_{mode}", outcome="rejected")
+            await safe_edit(flight.status, reason, reply_markup=main_menu_keyboard())
 
-    USER_TASKS[uid] = asyncio.create_task(job())
+        return SCHEDULER.run(uid, lambda: job(flight), on_queue, on_reject)
+
+    # ✅ cancel token + stage of this job (cancel button => handle.cancel())
+    status_id = getattr(status, "id", 0)
+    handle = TASKS.open(uid, status_id, f"url_{mode}")
+
+    # ✅ unfinished until the task ends => restored after a restart
+    if status_id:
+        handle.record = f"url:{uid}:{status_id}"
+        JOB_STORE.add(handle.record, "url", uid, chat_id, status_id, {"url": url, "mode": mode}, created)
+
+    # ✅ same URL + mode already running => attach instead of 2nd download
+    flight, leader = await join_or_start(f"url:{mode}:{url}", uid, chat_id, status, scheduled)
+    if leader:
+        TASKS.bind(handle, flight.task)
+    else:
+        forget_url(uid, url)
+        handle.kind = "follow"
+        TASKS.bind(handle, asyncio.create_task(follow(flight, sub_key(uid, status))))
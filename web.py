@@ -1,5 +1,9 @@
 import os
-from flask import Flask
+import time
+from flask import Flask, Response
+
+from store import read_state, read_text_state
+from metrics import METRICS_FILE
 
 app = Flask(__name__)
 
@@ -9,7 +13,24 @@ def home():
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    # ✅ written by bot.py (separate process): capabilities on startup, stats every 30s
+    return {
+        "status": "ok",
+        "capabilities": read_state("capabilities.json"),
+        "stats": read_state("stats.json"),
+    }
+
+@app.get("/metrics")
+def metrics():
+    # ✅ Prometheus text rendered by bot.py every METRICS_EVERY s; snapshot age => alert on a dead bot
+    text, mtime = read_text_state(METRICS_FILE)
+    age = time.time() - mtime if mtime else -1
+    body = (text or "") + (
+        "# HELP bot_metrics_age_seconds Seconds since the bot wrote this snapshot (-1 = never)\n"
+        "# TYPE bot_metrics_age_seconds gauge\n"
+        f"bot_metrics_age_seconds {age:.1f}\n"
+    )
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "10000"))
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import YTDL_WORKERS
+
+try:
+    import yt_dlp
+except ImportError:
+    yt_dlp = None
+
+
+# ===============================
+# In-process yt-dlp engine ✅
+# ===============================
+# - yt-dlp used as a library (no interpreter start + extractor import per reel)
+# - each worker thread keeps ONE YoutubeDL: extractors, cookies and HTTP
+#   handlers stay warm between requests
+# - progress comes from progress hooks (structured dict), not stdout parsing
+
+BASE_OPTS = {
+    "quiet": True,
+    "no_warnings": True,
+    "noprogress": True,
+    "noplaylist": True,
+    "socket_timeout": 25,
+    "retries": 3,
+    "fragment_retries": 3,
+    "format": "best[ext=mp4]/best",
+    "outtmpl": "%(id)s.%(ext)s",
+    "writethumbnail": True,     # next to the video (reel.jpg) => no ffmpeg frame grab
+}
+
+_POOL = ThreadPoolExecutor(max_workers=max(1, YTDL_WORKERS), thread_name_prefix="ytdl")
+_LOCAL = threading.local()
+
+
+class DownloadAborted(Exception):
+    pass
+
+
+def available():
+    return yt_dlp is not None
+
+
+def _dispatch_progress(d):
+    """
+    permanent hook on the worker's YoutubeDL => forwards to current job
+    """
+    job = getattr(_LOCAL, "job", None)
+    if not job:
+        return
+    if job["cancel"].is_set():
+        raise DownloadAborted("cancelled")
+    job["loop"].call_soon_threadsafe(job["on_progress"], {
+        "status": d.get("status"),
+        "downloaded": d.get("downloaded_bytes") or 0,
+        "total": d.get("total_bytes") or d.get("total_bytes_estimate") or 0,
+        "speed": d.get("speed") or 0,
+        "eta": d.get("eta") or 0,
+    })
+
+
+def _worker_ydl():
+    ydl = getattr(_LOCAL, "ydl", None)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(dict(BASE_OPTS))
+        ydl.add_progress_hook(_dispatch_progress)
+        _LOCAL.ydl = ydl
+    return ydl
+
+
+def _result_path(ydl, info: dict):
+    for d in info.get("requested_downloads") or []:
+        if d.get("filepath"):
+            return d["filepath"]
+    return info.get("filepath") or ydl.prepare_filename(info)
+
+
+def _run_job(url: str, outtmpl: str, job: dict):
+    ydl = _worker_ydl()
+    ydl.params["outtmpl"]["default"] = outtmpl
+    _LOCAL.job = job
+    try:
+        info = ydl.extract_info(url, download=True)
+        info = ydl.sanitize_info(info) if info else {}
+        return _result_path(ydl, info), info
+    finally:
+        _LOCAL.job = None
+
+
+async def ytdl_download(url: str, outtmpl: str, on_progress=None):
+    """
+    ✅ Download on a warm worker thread
+    on_progress(dict) runs on the event loop: status/downloaded/total/speed/eta
+    Task cancelled => worker aborts at next progress tick
+    returns: (filepath, info_dict)
+    """
+    if yt_dlp is None:
+        raise Exception("yt-dlp library not installed")
+
+    loop = asyncio.get_running_loop()
+    job = {
+        "loop": loop,
+        "cancel": threading.Event(),
+        "on_progress": on_progress or (lambda d: None),
+    }
+
+    fut = loop.run_in_executor(_POOL, _run_job, url, outtmpl, job)
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        job["cancel"].set()
+        raise
+    except Exception as e:
+        if job["cancel"].is_set():
+            raise asyncio.CancelledError
+        msg = str(e).replace("ERROR: ", "").strip()
+        raise Exception(msg[:300] or "yt-dlp error")